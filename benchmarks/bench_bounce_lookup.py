@@ -0,0 +1,67 @@
+"""
+Measures the bounce hook's EmailMessage lookup as the table grows, with and
+without the indexes added in migration 0007.
+
+    python benchmarks/bench_bounce_lookup.py --sizes 1000,10000,100000
+"""
+from optparse import OptionParser
+import random
+import uuid
+
+from utils import setup_database, teardown_database, timed, percentile
+
+def populate(count, start):
+    from django.utils import timezone
+    from postmark.models import EmailMessage, EmailContent
+
+    content, created = EmailContent.objects.get_or_create(content_hash="0" * 40, defaults={
+        "text_body": "Hello", "html_body": "", "headers": "", "attachments": ""})
+    now = timezone.now()
+
+    keys = []
+    for offset in xrange(start, start + count, 5000):
+        rows = []
+        for i in xrange(offset, min(start + count, offset + 5000)):
+            message_id = str(uuid.uuid4())
+            to = "user%d@example.com" % i
+            keys.append((message_id, to))
+            rows.append(EmailMessage(message_id=message_id, to=to, to_type="to", submitted_at=now,
+                status="OK", sender="sender@example.com", subject="Benchmark", tag="benchmark", content=content))
+        EmailMessage.objects.bulk_create(rows)
+    return keys
+
+def measure(keys, lookups):
+    from postmark.models import EmailMessage
+
+    timings = []
+    for message_id, to in random.sample(keys, min(lookups, len(keys))):
+        seconds, email = timed(EmailMessage.objects.get, message_id=message_id, to=to)
+        timings.append(seconds * 1000)
+    return sum(timings) / len(timings), percentile(timings, 95)
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--sizes", default="1000,10000,100000", help="Comma separated table sizes to measure at.")
+    parser.add_option("--lookups", type="int", default=500, help="Number of lookups per measurement.")
+    options, args = parser.parse_args()
+
+    from django.core.management import call_command
+
+    old_name = setup_database()
+    try:
+        keys = []
+        print "%10s %14s %14s %14s %14s" % ("rows", "mean ms", "p95 ms", "mean ms (idx)", "p95 ms (idx)")
+        for size in [int(size) for size in options.sizes.split(",")]:
+            keys.extend(populate(size - len(keys), len(keys)))
+
+            call_command("migrate", "postmark", "0006", verbosity=0)
+            without = measure(keys, options.lookups)
+            call_command("migrate", "postmark", verbosity=0)
+            indexed = measure(keys, options.lookups)
+
+            print "%10d %14.3f %14.3f %14.3f %14.3f" % ((size,) + without + indexed)
+    finally:
+        teardown_database(old_name)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Measures converting Django EmailMessages to Postmark payloads and
+serializing them, comparing PostmarkMessage with the dict based
+representation it replaced and the JSON libraries that are installed.
+
+    python benchmarks/bench_messages.py --messages 10000
+"""
+from optparse import OptionParser
+import timeit
+
+import utils
+
+from django.core.mail import EmailMultiAlternatives
+from django.utils.importlib import import_module
+
+from postmark.backends import PostmarkMessage
+from postmark import encoding
+
+ENCODERS = ["json.dumps", "simplejson.dumps", "ujson.dumps", "cjson.encode"]
+
+class LegacyPostmarkMessage(dict):
+    """
+    The dict based PostmarkMessage, minus attachments and suppression.
+    """
+
+    def __init__(self, message):
+        message_dict = {}
+
+        message_dict["From"] = message.from_email
+        message_dict["Subject"] = unicode(message.subject)
+        message_dict["TextBody"] = unicode(message.body)
+        message_dict["To"] = ",".join(message.to)
+
+        if len(message.cc):
+            message_dict["Cc"] = ",".join(message.cc)
+        if len(message.bcc):
+            message_dict["Bcc"] = ",".join(message.bcc)
+
+        if isinstance(message, EmailMultiAlternatives):
+            for alt in message.alternatives:
+                if alt[1] == "text/html":
+                    message_dict["HtmlBody"] = unicode(alt[0])
+
+        if message.extra_headers and isinstance(message.extra_headers, dict):
+            extra_headers = dict(message.extra_headers)
+            if extra_headers.has_key("Reply-To"):
+                message_dict["ReplyTo"] = extra_headers.pop("Reply-To")
+            if extra_headers.has_key("X-Postmark-Tag"):
+                message_dict["Tag"] = extra_headers.pop("X-Postmark-Tag")
+            if len(extra_headers):
+                message_dict["Headers"] = [{"Name": x[0], "Value": x[1]} for x in extra_headers.items()]
+
+        super(LegacyPostmarkMessage, self).__init__(message_dict)
+
+def make_messages(count):
+    messages = []
+    for i in xrange(count):
+        message = EmailMultiAlternatives(
+            subject=u"Your order #%d has shipped" % i,
+            body=u"Hello,\n\nYour order #%d is on its way.\n" % i * 5,
+            from_email="shop@example.com",
+            to=["customer%d@example.com" % i],
+            bcc=["archive@example.com"],
+            headers={"X-Postmark-Tag": "shipping", "Reply-To": "support@example.com", "X-Order": str(i)},
+        )
+        message.attach_alternative(u"<p>Hello,</p><p>Your order <b>#%d</b> is on its way.</p>" % i * 5, "text/html")
+        messages.append(message)
+    return messages
+
+def available_encoders():
+    encoders = []
+    for path in ENCODERS:
+        module_name, attr = path.rsplit(".", 1)
+        try:
+            encoders.append((path, getattr(import_module(module_name), attr)))
+        except (ImportError, AttributeError):
+            pass
+    return encoders
+
+def best_of(func, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--messages", type="int", default=10000, help="Number of messages to convert and serialize.")
+    parser.add_option("--repeat", type="int", default=3, help="Number of runs to take the best of.")
+    options, args = parser.parse_args()
+
+    emails = make_messages(options.messages)
+    n = options.messages
+
+    legacy = [LegacyPostmarkMessage(message) for message in emails]
+    current = [PostmarkMessage(message) for message in emails]
+    assert [dict(message) for message in legacy] == [message.to_dict() for message in current]
+
+    print "%d messages, best of %d" % (n, options.repeat)
+    for name, func in [
+            ("convert legacy dict", lambda: [LegacyPostmarkMessage(message) for message in emails]),
+            ("convert PostmarkMessage", lambda: [PostmarkMessage(message) for message in emails])]:
+        seconds = best_of(func, options.repeat)
+        print "%-32s %8.3f s %8.2f us/message" % (name, seconds, seconds / n * 1000000)
+
+    for path, dumps in available_encoders():
+        encoding._codec["POSTMARK_JSON_ENCODER"] = dumps
+        seconds = best_of(lambda: [encoding.dumps(message) for message in current], options.repeat)
+        print "%-32s %8.3f s %8.2f us/message" % ("serialize " + path, seconds, seconds / n * 1000000)
+
+        seconds = best_of(lambda: encoding.encode_body(current[:500]), options.repeat)
+        print "%-32s %8.3f s %8.2f us/message" % ("  batch of 500", seconds, seconds / 500 * 1000000)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Runs the end to end benchmarks against a local FakePostmark server and a
+throwaway database:
+
+* send: PostmarkBackend.send_messages throughput and per call latency, with
+  the EmailMessage log disconnected.
+* send+persist: the same with the log written, as in production.
+* persist: the post_send_batch receiver on its own.
+* bounce: bounce hook ingestion rate, single and in arrays, as the
+  EmailMessage table grows.
+* sync: postmark_sync_bounces backfill rate from the server's bounces API.
+
+The numbers are printed as JSON and can be saved and compared between
+releases:
+
+    python benchmarks/bench_suite.py --output before.json
+    python benchmarks/bench_suite.py --compare before.json
+"""
+from __future__ import with_statement
+
+from optparse import OptionParser
+import itertools
+import platform
+import random
+import sys
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from utils import setup_database, teardown_database, timed, percentile
+from server import FakePostmark, SUBMITTED_AT
+from bench_bounce_lookup import populate
+
+def make_messages(count):
+    from django.core.mail import EmailMultiAlternatives
+
+    messages = []
+    for i in xrange(count):
+        message = EmailMultiAlternatives(u"Benchmark %d" % i, u"Hello number %d\n" % i * 10, "sender@example.com",
+            ["user%d@example.com" % i], headers={"X-Postmark-Tag": "benchmark"})
+        message.attach_alternative(u"<p>Hello number %d</p>" % i * 10, "text/html")
+        messages.append(message)
+    return messages
+
+def bench_send(server, options, persist):
+    from postmark.backends import PostmarkBackend
+    from postmark.models import sent_messages
+    from postmark.signals import post_send_batch
+
+    if not persist:
+        post_send_batch.disconnect(sent_messages)
+    try:
+        backend = PostmarkBackend(api_url=server.url, api_batch_url=server.url + "/batch", concurrency=options.concurrency)
+        messages = make_messages(options.messages)
+        calls = [messages[i:i + options.call_size] for i in xrange(0, len(messages), options.call_size)]
+
+        backend.open()
+        try:
+            timings = []
+            total = 0.0
+            for call in calls:
+                seconds, num_sent = timed(backend.send_messages, call)
+                timings.append(seconds * 1000)
+                total += seconds
+        finally:
+            backend.close()
+    finally:
+        if not persist:
+            post_send_batch.connect(sent_messages)
+
+    return {
+        "messages_per_second": len(messages) / total,
+        "call_ms_p50": percentile(timings, 50),
+        "call_ms_p95": percentile(timings, 95),
+        "call_ms_p99": percentile(timings, 99),
+    }
+
+def bench_persist(options):
+    from postmark.backends import PostmarkMessage
+    from postmark.models import sent_messages
+
+    messages = [PostmarkMessage(message) for message in make_messages(options.messages)]
+    ids = itertools.count(10 ** 9)
+    responses = [{"ErrorCode": 0, "Message": "OK", "MessageID": "persist-%d" % ids.next(),
+        "SubmittedAt": SUBMITTED_AT, "To": message["To"]} for message in messages]
+
+    total = 0.0
+    for i in xrange(0, len(messages), options.batch_size):
+        seconds, result = timed(sent_messages, sender=None, messages=messages[i:i + options.batch_size],
+            responses=responses[i:i + options.batch_size])
+        total += seconds
+    return {"rows_per_second": len(messages) / total}
+
+def bench_bounces(options):
+    from django.test.client import RequestFactory
+    from postmark.views import bounce
+
+    factory = RequestFactory()
+    ids = itertools.count(1)
+
+    def payload(key):
+        return {"ID": ids.next(), "Type": "HardBounce", "TypeCode": 1, "Name": "Hard bounce", "Tag": "benchmark",
+            "MessageID": key[0], "Email": key[1], "BouncedAt": SUBMITTED_AT, "Description": "Benchmark",
+            "Details": "Benchmark", "DumpAvailable": False, "Inactive": False, "CanActivate": True}
+
+    def post(data):
+        response = bounce(factory.post("/postmark/bounce/", json.dumps(data), content_type="application/json"))
+        assert response.status_code == 200, response.status_code
+
+    results = {}
+    keys = []
+    for size in [int(size) for size in options.table_sizes.split(",")]:
+        keys.extend(populate(size - len(keys), len(keys)))
+        sample = random.sample(keys, min(options.bounces, len(keys)))
+
+        singles = sample[:len(sample) // 10 or 1]
+        seconds, result = timed(lambda: [post(payload(key)) for key in singles])
+        results["bounce.single_per_second@%d" % size] = len(singles) / seconds
+
+        batches = [[payload(key) for key in sample[i:i + options.bounce_batch]] for i in xrange(0, len(sample), options.bounce_batch)]
+        seconds, result = timed(lambda: [post(batch) for batch in batches])
+        results["bounce.array_per_second@%d" % size] = len(sample) / seconds
+    return results
+
+def bench_sync(server, options):
+    from django.core.management import call_command
+    from postmark.models import EmailBounce
+
+    keys = populate(options.sync_bounces, 10 ** 8)
+    ids = itertools.count(10 ** 9)
+    days = ["2011-05-%02d" % day for day in xrange(23, 16, -1)]
+    server.bounces = [{"ID": ids.next(), "Type": "HardBounce", "TypeCode": 1, "Name": "Hard bounce", "Tag": "benchmark",
+        "MessageID": message_id, "Email": to, "BouncedAt": days[i * len(days) // len(keys)] + "T11:16:00.3018994-04:00",
+        "Description": "Benchmark", "Details": "Benchmark", "DumpAvailable": False, "Inactive": False, "CanActivate": True}
+        for i, (message_id, to) in enumerate(keys)]
+
+    before = EmailBounce.objects.count()
+    seconds, result = timed(call_command, "postmark_sync_bounces", since=days[-1], until=days[0],
+        api_key="benchmark", api_url=server.bounces_url, concurrency=options.sync_concurrency, verbosity=0)
+    assert EmailBounce.objects.count() - before == len(keys)
+    return {"sync.bounces_per_second": len(keys) / seconds}
+
+def compare(old, new):
+    print "%-40s %14s %14s %9s" % ("metric", "before", "after", "change")
+    for key in sorted(set(old["results"]) & set(new["results"])):
+        before, after = old["results"][key], new["results"][key]
+        print "%-40s %14.2f %14.2f %+8.1f%%" % (key, before, after, (after - before) / before * 100 if before else 0)
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--messages", type="int", default=2000, help="Number of messages to send per send benchmark.")
+    parser.add_option("--call-size", type="int", default=100, help="Messages per send_messages call.")
+    parser.add_option("--batch-size", type="int", default=500, help="Messages per post_send_batch in the persist benchmark.")
+    parser.add_option("--concurrency", type="int", default=1, help="Backend concurrency.")
+    parser.add_option("--latency", type="float", default=5, help="Milliseconds the fake server takes per request.")
+    parser.add_option("--jitter", type="float", default=0, help="Random extra milliseconds per request.")
+    parser.add_option("--error-rate", type="float", default=0.0, help="Fraction of requests the fake server fails.")
+    parser.add_option("--table-sizes", default="1000,10000,50000", help="Comma separated EmailMessage table sizes for the bounce benchmark.")
+    parser.add_option("--bounces", type="int", default=1000, help="Number of bounces to ingest per table size.")
+    parser.add_option("--bounce-batch", type="int", default=100, help="Bounces per array posted to the hook.")
+    parser.add_option("--sync-bounces", type="int", default=20000, help="Number of bounces to backfill in the sync benchmark.")
+    parser.add_option("--sync-concurrency", type="int", default=4, help="Pages fetched at once in the sync benchmark.")
+    parser.add_option("--output", help="Write the results to this JSON file.")
+    parser.add_option("--compare", help="Compare the results with a JSON file written by --output.")
+    options, args = parser.parse_args()
+
+    import django
+    from django.db import connection
+
+    server = FakePostmark(latency=options.latency, jitter=options.jitter, error_rate=options.error_rate).start()
+    old_name = setup_database()
+    try:
+        results = {}
+        for name, value in bench_send(server, options, persist=False).iteritems():
+            results["send.%s" % name] = value
+        for name, value in bench_send(server, options, persist=True).iteritems():
+            results["send+persist.%s" % name] = value
+        for name, value in bench_persist(options).iteritems():
+            results["persist.%s" % name] = value
+        results.update(bench_bounces(options))
+        results.update(bench_sync(server, options))
+        results["server.errors"] = server.stats.get("errors", 0)
+    finally:
+        teardown_database(old_name)
+        server.stop()
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.settings_dict["ENGINE"],
+        },
+        "options": options.__dict__,
+        "results": results,
+    }
+    json.dump(report, sys.stdout, indent=2, sort_keys=True)
+    print
+
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if options.compare:
+        with open(options.compare) as f:
+            compare(json.load(f), report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Compares the per call cost of postmark.timestamps.parse_timestamp with the
+strptime based parsing the models and the bounce view used to carry.
+
+    python benchmarks/bench_timestamps.py --calls 100000
+"""
+from optparse import OptionParser
+from datetime import datetime
+from pytz import timezone
+import timeit
+import pytz
+
+import utils
+
+from postmark.timestamps import parse_timestamp
+
+SAMPLES = [
+    "2011-05-23T11:16:00.3018994+01:00",
+    "2011-05-23T11:16:00.3018994-04:00",
+    "2011-05-23T11:16:00+05:30",
+]
+
+def legacy_parse_timestamp(value):
+    timestamp, tz = value.rsplit("+", 1)
+    tz_offset = int(tz.split(":", 1)[0])
+    tz = timezone("Etc/GMT%s%d" % ("+" if tz_offset >= 0 else "-", tz_offset))
+    return tz.localize(datetime.strptime(timestamp[:26], "%Y-%m-%dT%H:%M:%S.%f")).astimezone(pytz.utc)
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--calls", type="int", default=100000, help="Number of calls to time per parser.")
+    options, args = parser.parse_args()
+
+    value = SAMPLES[0]
+    for name, func in [("legacy", legacy_parse_timestamp), ("parse_timestamp", parse_timestamp)]:
+        seconds = min(timeit.repeat(lambda: func(value), number=options.calls, repeat=3))
+        print "%-16s %8.3f us/call" % (name, seconds / options.calls * 1000000)
+
+    for sample in SAMPLES:
+        print "%-36s -> %s" % (sample, parse_timestamp(sample).isoformat())
+
+if __name__ == "__main__":
+    main()
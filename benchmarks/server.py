@@ -0,0 +1,171 @@
+"""
+A local stand-in for Postmark's API, for benchmarking without the network.
+It implements POST /email and /email/batch and GET /bounces, with
+configurable latency and error injection, and can be run on its own:
+
+    python benchmarks/server.py --port 8025 --latency 20 --error-rate 0.01
+
+or started in process with FakePostmark(...).start().
+"""
+from __future__ import with_statement
+
+from optparse import OptionParser
+import BaseHTTPServer
+import SocketServer
+import urlparse
+import threading
+import itertools
+import random
+import time
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+SUBMITTED_AT = "2011-05-23T11:16:00.3018994-04:00"
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        if not self.check(url.path, ("/bounces",)):
+            return
+        query = urlparse.parse_qs(url.query)
+
+        # fromdate and todate, a day or a time of day, compare with as much of
+        # BouncedAt, both inclusive
+        count, offset = int(query["count"][0]), int(query["offset"][0])
+        fromdate, todate = query.get("fromdate", [""])[0], query.get("todate", ["9999"])[0]
+        bounces = [bounce for bounce in self.server.bounces
+            if fromdate <= bounce["BouncedAt"][:len(fromdate)] and bounce["BouncedAt"][:len(todate)] <= todate]
+        self.server.count("pages")
+        self.respond(200, {"TotalCount": len(bounces), "Bounces": bounces[offset:offset + count]})
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not self.check(self.path, ("/email", "/email/batch")):
+            return
+
+        payload = json.loads(body)
+        server.count("requests")
+        server.count("bytes", len(body))
+        if self.path == "/email/batch":
+            server.count("messages", len(payload))
+            return self.respond(200, [server.result(message) for message in payload])
+        server.count("messages")
+        return self.respond(200, server.result(payload))
+
+    def check(self, path, paths):
+        """
+        Applies the latency and answers 404, 401 or an injected 503 if due.
+        Returns whether the request should be handled.
+        """
+        server = self.server
+        if server.latency or server.jitter:
+            time.sleep((server.latency + random.uniform(0, server.jitter)) / 1000.0)
+
+        if path not in paths:
+            self.respond(404, {"ErrorCode": 404, "Message": "Not found."})
+        elif self.headers.get("X-Postmark-Server-Token") is None:
+            self.respond(401, {"ErrorCode": 10, "Message": "No Account or Server API tokens were supplied."})
+        elif server.error_rate and random.random() < server.error_rate:
+            server.count("errors")
+            self.respond(503, {"ErrorCode": 503, "Message": "Injected error."}, {"Retry-After": "0"})
+        else:
+            return True
+        return False
+
+    def respond(self, status, content, headers=None):
+        content = json.dumps(content)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in (headers or {}).iteritems():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+class FakePostmark(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    The fake API server. latency and jitter are in milliseconds, error_rate is
+    the fraction of requests answered with a 503 and reject_rate the fraction
+    of messages rejected with ErrorCode 300. Accepted messages get a unique
+    MessageID. GET /bounces pages through the bounces list in the order given,
+    which is newest first at Postmark.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0, jitter=0, error_rate=0.0, reject_rate=0.0):
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port), Handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.reject_rate = reject_rate
+        self.stats = {}
+        self.bounces = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return "http://%s:%d/email" % self.server_address
+
+    @property
+    def bounces_url(self):
+        return "http://%s:%d/bounces" % self.server_address
+
+    def count(self, key, value=1):
+        with self._lock:
+            self.stats[key] = self.stats.get(key, 0) + value
+
+    def result(self, message):
+        if self.reject_rate and random.random() < self.reject_rate:
+            return {"ErrorCode": 300, "Message": "Invalid 'To' address."}
+        return {
+            "ErrorCode": 0,
+            "Message": "OK",
+            "MessageID": "00000000-0000-0000-0000-%012d" % self._ids.next(),
+            "SubmittedAt": SUBMITTED_AT,
+            "To": message.get("To"),
+        }
+
+    def start(self):
+        """
+        Serves from a daemon thread and returns the server.
+        """
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--host", default="127.0.0.1")
+    parser.add_option("--port", type="int", default=8025)
+    parser.add_option("--latency", type="float", default=0, help="Milliseconds added to every response.")
+    parser.add_option("--jitter", type="float", default=0, help="Up to this many random milliseconds added on top.")
+    parser.add_option("--error-rate", type="float", default=0.0, help="Fraction of requests answered with a 503.")
+    parser.add_option("--reject-rate", type="float", default=0.0, help="Fraction of messages rejected.")
+    options, args = parser.parse_args()
+
+    server = FakePostmark(options.host, options.port, options.latency, options.jitter, options.error_rate, options.reject_rate)
+    print "Serving on %s" % server.url
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""
+Settings for running the benchmarks. SQLite is used unless the
+POSTMARK_BENCH_DB_* environment variables point somewhere else, e.g.:
+
+    POSTMARK_BENCH_DB_ENGINE=django.db.backends.postgresql_psycopg2
+    POSTMARK_BENCH_DB_NAME=postmark_bench
+"""
+import os
+import tempfile
+
+DATABASES = {
+    "default": {
+        "ENGINE": os.environ.get("POSTMARK_BENCH_DB_ENGINE", "django.db.backends.sqlite3"),
+        "NAME": os.environ.get("POSTMARK_BENCH_DB_NAME", os.path.join(tempfile.gettempdir(), "postmark_bench.sqlite")),
+        "USER": os.environ.get("POSTMARK_BENCH_DB_USER", ""),
+        "PASSWORD": os.environ.get("POSTMARK_BENCH_DB_PASSWORD", ""),
+        "HOST": os.environ.get("POSTMARK_BENCH_DB_HOST", ""),
+        "PORT": os.environ.get("POSTMARK_BENCH_DB_PORT", ""),
+        "TEST_NAME": os.environ.get("POSTMARK_BENCH_DB_TEST_NAME", os.path.join(tempfile.gettempdir(), "test_postmark_bench.sqlite")),
+    }
+}
+
+INSTALLED_APPS = [
+    "django.contrib.auth",
+    "django.contrib.contenttypes",
+    "south",
+    "postmark",
+]
+
+SECRET_KEY = "postmark-benchmarks"
+USE_TZ = True
+
+POSTMARK_API_KEY = "POSTMARK_API_TEST"
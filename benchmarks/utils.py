@@ -0,0 +1,38 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+
+def setup_database():
+    """
+    Creates a fresh test database with every postmark migration applied and
+    returns the name of the database it replaced, for teardown_database.
+    """
+    from django.db import connection
+    from django.core.management import call_command
+
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0)
+    call_command("migrate", "postmark", verbosity=0)
+    return old_name
+
+def teardown_database(old_name):
+    from django.db import connection
+
+    connection.creation.destroy_test_db(old_name, verbosity=0)
+
+def timed(func, *args, **kwargs):
+    """
+    Calls func and returns a (seconds, result) tuple.
+    """
+    start = time.time()
+    result = func(*args, **kwargs)
+    return time.time() - start, result
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))]
@@ -1,7 +1,167 @@
 from django.utils.translation import ugettext_lazy as _
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.core.paginator import Paginator, InvalidPage
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.db import connections
+from django.conf import settings
+import re
 
-from postmark.models import EmailMessage, EmailBounce
+from postmark.models import EmailMessage, EmailBounce, QueuedMessage, Suppression, DeliveryStat, InboundMessage, InboundAttachment, EmailEvent
+
+# Settings
+POSTMARK_ADMIN_LARGE_TABLES = getattr(settings, "POSTMARK_ADMIN_LARGE_TABLES", False)
+POSTMARK_ADMIN_COUNT_LIMIT = getattr(settings, "POSTMARK_ADMIN_COUNT_LIMIT", 10000)
+POSTMARK_ADMIN_FILTER_CHOICES = getattr(settings, "POSTMARK_ADMIN_FILTER_CHOICES", {})
+
+# Number of most recent rows the filter choices are taken from
+RECENT_ROWS = 1000
+
+MESSAGE_ID_RE = re.compile(r"^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$")
+
+def estimated_count(queryset):
+    """
+    Counts queryset without scanning a large table. An unfiltered queryset is
+    counted from the database's table statistics on PostgreSQL and MySQL,
+    anything else is counted exactly up to POSTMARK_ADMIN_COUNT_LIMIT rows.
+    """
+    connection = connections[queryset.db]
+    cursor = connection.cursor()
+    
+    if not queryset.query.where:
+        table = queryset.model._meta.db_table
+        engine = connection.settings_dict["ENGINE"]
+        
+        estimate = None
+        if "postgresql" in engine:
+            cursor.execute("SELECT reltuples FROM pg_class WHERE relname = %s", [table])
+            row = cursor.fetchone()
+            estimate = row and int(row[0])
+        elif "mysql" in engine:
+            cursor.execute("SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s", [table])
+            row = cursor.fetchone()
+            estimate = row and int(row[0])
+        
+        if estimate is not None and estimate > POSTMARK_ADMIN_COUNT_LIMIT:
+            return estimate
+    
+    # A sliced QuerySet.count() counts every row and caps the result, so the
+    # limited query is counted as a subquery instead.
+    limited = queryset.order_by().values_list("pk", flat=True)[:POSTMARK_ADMIN_COUNT_LIMIT]
+    sql, params = limited.query.get_compiler(queryset.db).as_sql()
+    cursor.execute("SELECT COUNT(*) FROM (%s) limited" % sql, params)
+    return cursor.fetchone()[0]
+
+class EstimatedCountPaginator(Paginator):
+    """
+    A Paginator that takes its count from estimated_count.
+    """
+    
+    def _get_count(self):
+        if self._count is None:
+            self._count = estimated_count(self.object_list)
+        return self._count
+    count = property(_get_count)
+
+class LargeTableChangeList(ChangeList):
+    """
+    A ChangeList that never counts or searches a whole table: counts are
+    estimated and searching is left to the ModelAdmin's search_large method,
+    which is expected to use indexed lookups only.
+    """
+    
+    def get_query_set(self, request):
+        query, self.query = self.query, ""
+        try:
+            qs = super(LargeTableChangeList, self).get_query_set(request)
+        finally:
+            self.query = query
+        
+        if query.strip():
+            qs = self.model_admin.search_large(qs, query.strip())
+        return qs
+    
+    def get_results(self, request):
+        paginator = self.model_admin.get_paginator(request, self.query_set, self.list_per_page)
+        result_count = paginator.count
+        
+        if not self.query_set.query.where:
+            full_result_count = result_count
+        else:
+            full_result_count = estimated_count(self.root_query_set)
+        
+        can_show_all = result_count <= self.list_max_show_all
+        multi_page = result_count > self.list_per_page
+        
+        if (self.show_all and can_show_all) or not multi_page:
+            result_list = self.query_set._clone()
+        else:
+            try:
+                result_list = paginator.page(self.page_num + 1).object_list
+            except InvalidPage:
+                raise IncorrectLookupParameters
+        
+        self.result_count = result_count
+        self.full_result_count = full_result_count
+        self.result_list = result_list
+        self.can_show_all = can_show_all
+        self.multi_page = multi_page
+        self.paginator = paginator
+
+class LargeTableAdmin(object):
+    """
+    Mixin for the ModelAdmins used with POSTMARK_ADMIN_LARGE_TABLES.
+    """
+    
+    paginator = EstimatedCountPaginator
+    
+    def get_changelist(self, request, **kwargs):
+        return LargeTableChangeList
+    
+    def search_large(self, queryset, query):
+        """
+        Returns queryset narrowed down to the rows matching query, using
+        indexed lookups only. By default that is an exact match on the
+        message_id field, if the model has one, and no search at all
+        otherwise.
+        """
+        if "message_id" in queryset.model._meta.get_all_field_names():
+            return queryset.filter(message_id=query)
+        return queryset
+
+class RecentValuesFilter(admin.SimpleListFilter):
+    """
+    Filters on the values of field without a DISTINCT over the whole table.
+    The choices are POSTMARK_ADMIN_FILTER_CHOICES[parameter_name] if set, or
+    else the values found in the RECENT_ROWS most recent rows.
+    """
+    
+    field = None
+    
+    def lookups(self, request, model_admin):
+        choices = POSTMARK_ADMIN_FILTER_CHOICES.get(self.parameter_name)
+        if choices is None:
+            recent = model_admin.model._default_manager.order_by("-pk").values_list(self.field, flat=True)[:RECENT_ROWS]
+            choices = sorted(set(recent))
+        return [(value, value or _("(None)")) for value in choices]
+    
+    def queryset(self, request, queryset):
+        if self.value() is not None:
+            return queryset.filter(**{self.field: self.value()})
+        return queryset
+
+class StatusFilter(RecentValuesFilter):
+    title = _("Status")
+    parameter_name = field = "status"
+
+class TagFilter(RecentValuesFilter):
+    title = _("Tag")
+    parameter_name = field = "tag"
+
+class MessageTagFilter(RecentValuesFilter):
+    title = _("Tag")
+    parameter_name = "tag"
+    field = "message__tag"
 
 class EmailBounceAdmin(admin.ModelAdmin):
     list_display = ("get_message_to", "get_message_to_type", "get_message_subject", "get_message_tag", "type", "bounced_at")
@@ -42,7 +202,6 @@ class EmailMessageAdmin(admin.ModelAdmin):
     list_display = ("to", "to_type", "subject", "tag", "status", "submitted_at")
     list_filter = ("status", "tag", "to_type", "submitted_at")
     search_fields = ("message_id", "to", "subject")
-    list_select_related = True
     
     readonly_fields = ("message_id", "status", "subject", "tag", "to", "to_type", "sender", "reply_to", "submitted_at", "text_body", "html_body", "headers", "attachments")
     
@@ -66,5 +225,82 @@ class EmailMessageAdmin(admin.ModelAdmin):
         })
     )
 
-admin.site.register(EmailMessage, EmailMessageAdmin)
-admin.site.register(EmailBounce, EmailBounceAdmin)
\ No newline at end of file
+class QueuedMessageAdmin(admin.ModelAdmin):
+    list_display = ("id", "created_at", "attempts", "failed", "claimed_at")
+    list_filter = ("failed",)
+    
+    readonly_fields = ("payload", "created_at", "attempts", "failed", "last_error", "claimed_by", "claimed_at")
+
+class SuppressionAdmin(admin.ModelAdmin):
+    list_display = ("email", "reason", "created_at")
+    list_filter = ("reason",)
+    search_fields = ("^email",)
+
+class DeliveryStatAdmin(admin.ModelAdmin):
+    """
+    Browses the DeliveryStat rollups. They are maintained by postmark and
+    rebuilt with the postmark_rebuild_stats command, so they are read only.
+    """
+    list_display = ("day", "tag", "status", "bounce_type", "sent", "bounced")
+    list_filter = ("bounce_type", "status", "tag")
+    date_hierarchy = "day"
+    readonly_fields = list_display
+    
+    def has_add_permission(self, request):
+        return False
+
+class InboundAttachmentInline(admin.TabularInline):
+    model = InboundAttachment
+    fields = ("name", "content_type", "size", "file")
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+class InboundMessageAdmin(admin.ModelAdmin):
+    list_display = ("message_id", "from_email", "to", "subject", "received_at")
+    date_hierarchy = "received_at"
+    search_fields = ("=message_id", "^from_email", "=mailbox_hash")
+    inlines = [InboundAttachmentInline]
+
+class EmailEventAdmin(admin.ModelAdmin):
+    list_display = ("type", "message_id", "recipient", "tag", "occurred_at")
+    list_filter = ("type",)
+    search_fields = ("=message_id",)
+    readonly_fields = ("type", "message_id", "recipient", "tag", "occurred_at", "details")
+    
+    def has_add_permission(self, request):
+        return False
+
+class LargeEmailMessageAdmin(LargeTableAdmin, EmailMessageAdmin):
+    list_filter = (StatusFilter, TagFilter, "to_type", "submitted_at")
+    search_fields = ("=message_id", "^to")
+    
+    def search_large(self, queryset, query):
+        if MESSAGE_ID_RE.match(query):
+            return queryset.filter(message_id=query)
+        return queryset.filter(to__startswith=query)
+
+class LargeEmailBounceAdmin(LargeTableAdmin, EmailBounceAdmin):
+    list_filter = ("type", MessageTagFilter, "bounced_at")
+    search_fields = ("=message__message_id", "^message__to")
+    list_select_related = False
+    
+    def queryset(self, request):
+        return super(LargeEmailBounceAdmin, self).queryset(request).select_related("message").defer("description", "details")
+    
+    def search_large(self, queryset, query):
+        if MESSAGE_ID_RE.match(query):
+            return queryset.filter(message__message_id=query)
+        return queryset.filter(message__to__startswith=query)
+
+if POSTMARK_ADMIN_LARGE_TABLES:
+    admin.site.register(EmailMessage, LargeEmailMessageAdmin)
+    admin.site.register(EmailBounce, LargeEmailBounceAdmin)
+else:
+    admin.site.register(EmailMessage, EmailMessageAdmin)
+    admin.site.register(EmailBounce, EmailBounceAdmin)
+admin.site.register(QueuedMessage, QueuedMessageAdmin)
+admin.site.register(Suppression, SuppressionAdmin)
+admin.site.register(DeliveryStat, DeliveryStatAdmin)
+admin.site.register(InboundMessage, InboundMessageAdmin)
+admin.site.register(EmailEvent, EmailEventAdmin)
\ No newline at end of file
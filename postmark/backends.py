@@ -1,34 +1,52 @@
+from __future__ import with_statement
+
 from django.core.mail.backends.base import BaseEmailBackend
-from django.core.mail import EmailMultiAlternatives
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.core.exceptions import ImproperlyConfigured
 from django.core import serializers
+from django.utils.importlib import import_module
 from django.conf import settings
-import httplib2
+from django.db import connection
+from multiprocessing.pool import ThreadPool
+import itertools
+import threading
+import logging
+import time
+import sys
+import os
 
-try:
-    import json                     
-except ImportError:
-    try:
-        import simplejson as json
-    except ImportError:
-        raise Exception('Cannot use django-postmark without Python 2.6 or greater, or Python 2.4 or 2.5 and the "simplejson" library')
-        
-from postmark.signals import post_send
+from postmark.encoding import PostmarkAttachment, POSTMARK_ATTACHMENT_MAX_SIZE, dumps, loads, encode_body
+from postmark.models import QueuedMessage
+from postmark.resilience import RetryPolicy, CircuitOpenError, get_rate_limiter, get_circuit_breaker, parse_retry_after
+from postmark.signals import post_send, post_send_batch, post_convert, post_encode, pre_request, post_request, post_persist
+from postmark.suppression import POSTMARK_SUPPRESSION, normalize_address, suppressed_addresses
+from postmark.transports import TransportError, get_transport, POSTMARK_POOL_SIZE
+from postmark.routing import get_routes
 
 # Settings
 POSTMARK_API_KEY = getattr(settings, "POSTMARK_API_KEY", None)
 POSTMARK_SSL = getattr(settings, "POSTMARK_SSL", False)
 POSTMARK_TEST_MODE = getattr(settings, "POSTMARK_TEST_MODE", False)
+POSTMARK_CONCURRENCY = getattr(settings, "POSTMARK_CONCURRENCY", 1)
+POSTMARK_ASYNC_WORKERS = getattr(settings, "POSTMARK_ASYNC_WORKERS", 8)
+POSTMARK_FALLBACK_BACKEND = getattr(settings, "POSTMARK_FALLBACK_BACKEND", None)
+POSTMARK_ASYNC_ERROR_CALLBACK = getattr(settings, "POSTMARK_ASYNC_ERROR_CALLBACK", None)
 
 POSTMARK_API_URL = ("https" if POSTMARK_SSL else "http") + "://api.postmarkapp.com/email"
+POSTMARK_API_BATCH_URL = POSTMARK_API_URL + "/batch"
+POSTMARK_API_BOUNCES_URL = ("https" if POSTMARK_SSL else "http") + "://api.postmarkapp.com/bounces"
+
+logger = logging.getLogger("postmark.backends")
 
 class PostmarkMailSendException(Exception):
     """
-    Base Postmark send exception
+    Base Postmark send exception, status is the HTTP status Postmark answered
+    with, if any.
     """
-    def __init__(self, value, inner_exception=None):
+    def __init__(self, value, inner_exception=None, status=None):
         self.parameter = value
         self.inner_exception = inner_exception
+        self.status = status
     def __str__(self):
         return repr(self.parameter)
 
@@ -53,10 +71,26 @@ class PostmarkMailServerErrorException(PostmarkMailSendException):
     """
     pass
 
-class PostmarkMessage(dict):
+class PostmarkMailAttachmentTooLargeException(PostmarkMailSendException):
+    """
+    The attachments of a message exceed POSTMARK_ATTACHMENT_MAX_SIZE, the
+    message is not sent.
+    """
+    pass
+
+class PostmarkMailCircuitOpenException(PostmarkMailSendException):
     """
-    Creates a Dictionary representation of a Django EmailMessage that is suitable
-    for submitting to Postmark's API. An Example Dicitionary would be:
+    Postmark's API is failing and the circuit breaker is open, the message
+    was not sent and no fallback backend is configured.
+    """
+    pass
+
+class PostmarkMessage(object):
+    """
+    A compact representation of a Django EmailMessage that is suitable for
+    submitting to Postmark's API. It is read like a dictionary keyed by the API's
+    field names, leaving out fields that are not set, and to_dict() returns the
+    payload itself. An Example Dicitionary would be:
     
         {
             "From" : "sender@example.com",
@@ -84,116 +118,685 @@ class PostmarkMessage(dict):
         }
     """
     
-    def __init__(self, message, fail_silently=False):
+    _FIELDS = (
+        ("From", "from_email"),
+        ("To", "to"),
+        ("Cc", "cc"),
+        ("Bcc", "bcc"),
+        ("Subject", "subject"),
+        ("Tag", "tag"),
+        ("HtmlBody", "html_body"),
+        ("TextBody", "text_body"),
+        ("ReplyTo", "reply_to"),
+        ("Headers", "headers"),
+        ("Attachments", "attachments"),
+    )
+    _ATTRS = dict(_FIELDS)
+    
+    __slots__ = ("from_email", "to", "cc", "bcc", "subject", "tag", "html_body", "text_body", "reply_to", "headers", "attachments", "message")
+    
+    def __init__(self, message, fail_silently=False, suppressed=None):
         """
         Takes a Django EmailMessage and parses it into a usable object for
-        sending to Postmark.
+        sending to Postmark. The EmailMessage is left untouched.
+        
+        suppressed is a set of normalized addresses to leave out of To, Cc and
+        Bcc. If no To recipient remains the result is empty, like a message
+        that failed to convert with fail_silently.
         """
-        try:
-            message_dict = {}
-            
-            message_dict["From"] = message.from_email
-            message_dict["Subject"] = unicode(message.subject)
-            message_dict["TextBody"] = unicode(message.body)
+        self.message = message
+        self._clear()
+        
+        to, cc, bcc = message.to, message.cc, message.bcc
+        if suppressed:
+            to, cc, bcc = [[address for address in addresses if normalize_address(address) not in suppressed]
+                for addresses in (to, cc, bcc)]
             
-            message_dict["To"] = ",".join(message.to)
+            if message.to and not to:
+                return
+        
+        try:
+            self.from_email = message.from_email
+            self.subject = unicode(message.subject)
+            self.text_body = unicode(message.body)
             
-            if len(message.cc):
-                message_dict["Cc"] = ",".join(message.cc)
-            if len(message.bcc):
-                message_dict["Bcc"] = ",".join(message.bcc)
+            self.to = ",".join(to)
+            self.cc = ",".join(cc) or None
+            self.bcc = ",".join(bcc) or None
             
             if isinstance(message, EmailMultiAlternatives):
-                for alt in message.alternatives:
-                    if alt[1] == "text/html":
-                        message_dict["HtmlBody"] = unicode(alt[0])
+                for content, mimetype in message.alternatives:
+                    if mimetype == "text/html":
+                        self.html_body = unicode(content)
             
             if message.extra_headers and isinstance(message.extra_headers, dict):
-                if message.extra_headers.has_key("Reply-To"):
-                    message_dict["ReplyTo"] = message.extra_headers.pop("Reply-To")
-                    
-                if message.extra_headers.has_key("X-Postmark-Tag"):
-                    message_dict["Tag"] = message.extra_headers.pop("X-Postmark-Tag")
-                    
-                if len(message.extra_headers):
-                    message_dict["Headers"] = [{"Name": x[0], "Value": x[1]} for x in message.extra_headers.items()]
+                headers = []
+                for name, value in message.extra_headers.iteritems():
+                    if name == "Reply-To":
+                        self.reply_to = value
+                    elif name == "X-Postmark-Tag":
+                        self.tag = value
+                    else:
+                        headers.append({"Name": name, "Value": value})
+                self.headers = headers or None
             
             if message.attachments and isinstance(message.attachments, list):
-                if len(message.attachments):
-                    message_dict["Attachments"] = message.attachments
+                attachments = [PostmarkAttachment.from_django(attachment) for attachment in message.attachments]
+                size = sum([len(attachment) for attachment in attachments])
+                if POSTMARK_ATTACHMENT_MAX_SIZE is not None and size > POSTMARK_ATTACHMENT_MAX_SIZE:
+                    raise PostmarkMailAttachmentTooLargeException("Attachments are %d bytes, the limit is %d bytes." % (size, POSTMARK_ATTACHMENT_MAX_SIZE))
+                self.attachments = attachments
             
         except:
             if fail_silently:
-                message_dict = {}
+                self._clear()
             else:
                 raise
-        
-        super(PostmarkMessage, self).__init__(message_dict)
+    
+    def _clear(self):
+        self.from_email = self.to = self.cc = self.bcc = None
+        self.subject = self.tag = self.html_body = self.text_body = None
+        self.reply_to = self.headers = self.attachments = None
+    
+    def __getitem__(self, key):
+        value = getattr(self, self._ATTRS[key])
+        if value is None:
+            raise KeyError(key)
+        return value
+    
+    def get(self, key, default=None):
+        attr = self._ATTRS.get(key)
+        value = getattr(self, attr) if attr is not None else None
+        return default if value is None else value
+    
+    def __contains__(self, key):
+        return self.get(key) is not None
+    
+    def iteritems(self):
+        for key, attr in self._FIELDS:
+            value = getattr(self, attr)
+            if value is not None:
+                yield key, value
+    
+    def keys(self):
+        return [key for key, value in self.iteritems()]
+    
+    def __iter__(self):
+        return iter(self.keys())
+    
+    def __len__(self):
+        return len(self.keys())
+    
+    def __repr__(self):
+        return "<PostmarkMessage: %r>" % dict(self.iteritems())
+    
+    def to_dict(self):
+        """
+        Returns the message as the plain dictionary posted to Postmark, with
+        the attachments base64 encoded.
+        """
+        data = dict(self.iteritems())
+        if self.attachments:
+            data["Attachments"] = [attachment.to_dict() for attachment in self.attachments]
+        return data
+
+def convert_messages(email_messages, fail_silently=False):
+    """
+    Converts EmailMessage objects to PostmarkMessage objects, leaving out the
+    ones that end up empty. With POSTMARK_SUPPRESSION enabled recipients on
+    the suppression list are dropped, checking every recipient of every
+    message at once.
+    """
+    suppressed = None
+    if POSTMARK_SUPPRESSION:
+        suppressed = suppressed_addresses(itertools.chain(*[message.recipients() for message in email_messages]))
+    
+    messages = []
+    for message in email_messages:
+        postmark_message = PostmarkMessage(message, fail_silently, suppressed)
+        if postmark_message:
+            messages.append(postmark_message)
+    return messages
+
+def _submit_group(group):
+    backend, chunks = group
+    return backend, chunks, backend._submit_all(chunks)
 
 class PostmarkBackend(BaseEmailBackend):
     
     BATCH_SIZE = 500
     
-    def __init__(self, api_key=None, api_url=None, api_batch_url=None, **kwargs):
+    def __init__(self, api_key=None, api_url=None, api_batch_url=None, transport=None, concurrency=None,
+                 retry_policy=None, rate_limiter=None, circuit_breaker=None, fallback=None, routes=None, **kwargs):
         """
-        Initialize the backend.
+        Initialize the backend. transport may be a transport instance or the
+        dotted path of a transport class, POSTMARK_TRANSPORT is used if it is
+        not given. concurrency is the number of chunks that may be in flight
+        at once, POSTMARK_CONCURRENCY is used if it is not given.
+        
+        retry_policy is a postmark.resilience.RetryPolicy and rate_limiter a
+        TokenBucket, by default they follow the POSTMARK_MAX_RETRIES and
+        POSTMARK_RATE_LIMIT settings and the limiter is shared by every backend
+        in the process using the same API key.
+        
+        circuit_breaker is a postmark.resilience.CircuitBreaker, shared the
+        same way and enabled by POSTMARK_BREAKER_FAILURES. While it is open,
+        messages are handed to fallback, an email backend instance or dotted
+        path (POSTMARK_FALLBACK_BACKEND by default), or fail with
+        PostmarkMailCircuitOpenException if there is none.
+        
+        routes is a list of postmark.routing.Route objects or dicts of their
+        arguments, POSTMARK_ROUTES by default. Messages matching a route are
+        sent with its server token by a backend of its own, with its own
+        worker pool, rate limiter and circuit breaker but this backend's
+        transport; the rest use api_key.
         """
         super(PostmarkBackend, self).__init__(**kwargs)
         
         self.api_key = api_key or POSTMARK_API_KEY
         self.api_url = api_url or POSTMARK_API_URL
+        self.api_batch_url = api_batch_url or POSTMARK_API_BATCH_URL
+        self.concurrency = max(concurrency or POSTMARK_CONCURRENCY, 1)
         
         if self.api_key is None:
             raise ImproperlyConfigured("POSTMARK_API_KEY must be set in Django settings file or passed to backend constructor.")
+        
+        if transport is None or isinstance(transport, basestring):
+            transport = get_transport(transport, pool_size=max(POSTMARK_POOL_SIZE, self.concurrency))
+        self.transport = transport
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.rate_limiter = rate_limiter or get_rate_limiter(self.api_key)
+        self.circuit_breaker = circuit_breaker or get_circuit_breaker(self.api_key)
+        self.fallback = fallback or POSTMARK_FALLBACK_BACKEND
+        self._pool = None
+        self._route_pool = None
+        self.routes = [(route, self._route_backend(route)) for route in get_routes(routes)]
+    
+    def _route_backend(self, route):
+        return PostmarkBackend(
+            api_key=route.api_key,
+            api_url=self.api_url,
+            api_batch_url=self.api_batch_url,
+            transport=self.transport,
+            concurrency=route.concurrency or self.concurrency,
+            retry_policy=self.retry_policy,
+            rate_limiter=get_rate_limiter(route.api_key, route.rate_limit, route.rate_burst),
+            circuit_breaker=get_circuit_breaker(route.api_key, name=route.name),
+            fallback=self.fallback,
+            routes=(),
+            fail_silently=self.fail_silently,
+        )
+    
+    def route(self, message):
+        """
+        Returns the backend that sends message, a PostmarkMessage or its
+        payload dict: that of the first route it matches, or this one.
+        """
+        for route, backend in self.routes:
+            if route.matches(message):
+                return backend
+        return self
+    
+    def open(self):
+        """
+        Opens the transport's connection pool, and the worker pool when
+        running concurrently, as well as those of every route. Returns True if
+        a new pool was created, in which case the caller is responsible for
+        closing it.
+        """
+        if self.concurrency > 1 and self._pool is None:
+            self._pool = ThreadPool(self.concurrency)
+        if self.routes and self._route_pool is None:
+            self._route_pool = ThreadPool(len(self.routes) + 1)
+        opened = self.transport.open()
+        for route, backend in self.routes:
+            opened = backend.open() or opened
+        return opened
+    
+    def close(self):
+        """
+        Closes the transport's connection pool and the worker pool, as well as
+        those of every route.
+        """
+        for pool in (self._pool, self._route_pool):
+            if pool is not None:
+                pool.close()
+                pool.join()
+        self._pool = self._route_pool = None
+        self.transport.close()
+        for route, backend in self.routes:
+            backend.close()
     
     def send_messages(self, email_messages):
         """
         Sends one or more EmailMessage objects and returns the number of email
         messages sent.
+        
+        Messages are submitted to Postmark's batch endpoint in chunks of up to
+        BATCH_SIZE, a chunk holding a single message goes to the regular
+        endpoint instead. Messages for different routes are never batched
+        together.
         """
         if not email_messages:
             return
         
+        groups = self._partition(email_messages)
+        
+        new_conn_created = self.open()
+        try:
+            return self._send(groups)
+        finally:
+            if new_conn_created:
+                self.close()
+    
+    def _partition(self, email_messages, fail_silently=None):
+        """
+        Converts email_messages to PostmarkMessage objects and splits them by
+        route into chunks of up to BATCH_SIZE. Returns a list of (backend,
+        chunks) pairs, one per backend that has messages to send.
+        """
+        start = time.time()
+        messages = convert_messages(email_messages, self.fail_silently if fail_silently is None else fail_silently)
+        post_convert.send(sender=self, batch_size=len(email_messages), duration=time.time() - start)
+        
+        groups = {}
+        for message in messages:
+            groups.setdefault(self.route(message), []).append(message)
+        
+        result = []
+        for backend in [self] + [backend for route, backend in self.routes]:
+            messages = groups.get(backend)
+            if messages:
+                result.append((backend, [messages[i:i + self.BATCH_SIZE] for i in xrange(0, len(messages), self.BATCH_SIZE)]))
+        return result
+    
+    def _send(self, groups):
+        if len(groups) > 1:
+            return self._send_routed(groups)
+        for backend, chunks in groups:
+            if backend._pool is not None and len(chunks) > 1:
+                return backend._send_concurrently(chunks)
+            return backend._send_chunks(chunks)
+        return 0
+    
+    def _send_chunks(self, chunks):
         num_sent = 0
-        for message in email_messages:
-            sent = self._send(PostmarkMessage(message, self.fail_silently))
-            if sent:
-                num_sent += 1
+        for chunk in chunks:
+            try:
+                responses = self._submit(chunk)
+            except PostmarkMailCircuitOpenException:
+                num_sent += self._fall_back(chunk, sys.exc_info())
+            else:
+                num_sent += self._process(chunk, responses)
+        return num_sent
+    
+    def _send_concurrently(self, chunks):
+        """
+        Submits chunks on the worker pool. Workers only perform the HTTP
+        requests; post_send is fired from the calling thread once every chunk
+        has finished, and the first error is raised after that so the messages
+        Postmark did accept are never lost.
+        """
+        num_sent, error = self._handle_results(chunks, self._pool.map(self._submit_safely, chunks))
+        if error is not None:
+            raise error[0], error[1], error[2]
         return num_sent
     
-    def _send(self, message):
-        http = httplib2.Http()
+    def _send_routed(self, groups):
+        """
+        Sends the chunks of each (backend, chunks) pair from a thread of its
+        own, so that a large send through one route does not hold up the
+        messages of another. As in _send_concurrently only the requests are
+        made from the threads: each route's results are processed in the
+        calling thread as soon as they are in, and the first error is raised
+        once every route has finished.
+        """
+        pool = self._route_pool or ThreadPool(len(groups))
+        try:
+            num_sent = 0
+            error = None
+            for backend, chunks, results in pool.imap_unordered(_submit_group, groups):
+                sent, exc_info = backend._handle_results(chunks, results)
+                num_sent += sent
+                if error is None:
+                    error = exc_info
+        finally:
+            if pool is not self._route_pool:
+                pool.close()
+                pool.join()
+        
+        if error is not None:
+            raise error[0], error[1], error[2]
+        return num_sent
+    
+    def _submit_all(self, chunks):
+        """
+        Submits chunks, on the worker pool if there is one, and returns a
+        (responses, exc_info) pair for each.
+        """
+        if self._pool is not None and len(chunks) > 1:
+            return self._pool.map(self._submit_safely, chunks)
+        return [self._submit_safely(chunk) for chunk in chunks]
+    
+    def _handle_results(self, chunks, results):
+        """
+        Processes the (responses, exc_info) pairs of submitting chunks, falling
+        back where the circuit breaker refused a chunk. Returns the number of
+        messages sent and the exc_info of the first error, or None.
+        """
+        num_sent = 0
+        error = None
+        for chunk, (responses, exc_info) in zip(chunks, results):
+            if exc_info is not None and issubclass(exc_info[0], PostmarkMailCircuitOpenException):
+                try:
+                    num_sent += self._fall_back(chunk, exc_info)
+                    exc_info = None
+                except Exception:
+                    exc_info = sys.exc_info()
+            elif exc_info is None:
+                try:
+                    num_sent += self._process(chunk, responses)
+                except PostmarkMailSendException:
+                    exc_info = sys.exc_info()
+            if exc_info is not None and error is None:
+                error = exc_info
+        return num_sent, error
+    
+    def _fall_back(self, chunk, exc_info):
+        """
+        Hands the EmailMessages behind chunk to the fallback backend and
+        returns the number it sent. Without a fallback the circuit breaker's
+        exception is raised, unless fail_silently is set.
+        """
+        if self.fallback is None:
+            if self.fail_silently:
+                return 0
+            raise exc_info[0], exc_info[1], exc_info[2]
+        
+        if isinstance(self.fallback, basestring):
+            self.fallback = get_connection(self.fallback, fail_silently=self.fail_silently)
+        return self.fallback.send_messages([message.message for message in chunk]) or 0
+    
+    def _submit_safely(self, chunk):
+        try:
+            return self._submit(chunk), None
+        except Exception:
+            return None, sys.exc_info()
+    
+    def _request(self, url, body, batch_size=1):
+        """
+        POSTs body to url and returns the transport's (status, headers,
+        content) tuple. Requests that got no response, or a status in
+        postmark.resilience.RETRY_STATUSES, are retried as far as the retry
+        policy allows, and every attempt waits for the rate limiter first.
+        Raises TransportError if the last attempt got no response.
+        
+        Attempts are reported to the circuit breaker. CircuitOpenError is
+        raised instead of making an attempt while it is open. pre_request and
+        post_request are sent around every attempt, the latter with a status
+        of None if there was no response.
+        """
+        breaker = self.circuit_breaker
+        size = len(body)
+        headers = {
+            "Accept": "application/json",
+            "Content-Type": "application/json",
+            "Content-Length": str(size),
+            "X-Postmark-Server-Token": self.api_key,
+        }
+        try:
+            attempt = 0
+            while True:
+                if self.rate_limiter is not None:
+                    self.rate_limiter.acquire()
+                if hasattr(body, "seek"):
+                    body.seek(0)
+                if breaker is not None and not breaker.allow():
+                    raise CircuitOpenError("The circuit breaker for %s is open." % breaker.name)
+                
+                pre_request.send(sender=self, url=url, batch_size=batch_size, bytes=size, attempt=attempt)
+                start = time.time()
+                try:
+                    status, response_headers, content = self.transport.request(url, body, headers)
+                except TransportError, e:
+                    post_request.send(sender=self, url=url, batch_size=batch_size, bytes=size, attempt=attempt,
+                        status=None, duration=time.time() - start)
+                    if breaker is not None:
+                        breaker.failure()
+                    if not self.retry_policy.should_retry(attempt, error=e):
+                        raise
+                    retry_after = None
+                else:
+                    duration = time.time() - start
+                    post_request.send(sender=self, url=url, batch_size=batch_size, bytes=size, attempt=attempt,
+                        status=status, duration=duration)
+                    if breaker is not None:
+                        if status >= 500 or status == 429:
+                            breaker.failure()
+                        else:
+                            breaker.success(duration)
+                    retry_after = parse_retry_after(response_headers.get("retry-after"))
+                    if not self.retry_policy.should_retry(attempt, status, retry_after):
+                        return status, response_headers, content
+                
+                if breaker is None or not breaker.is_open():
+                    time.sleep(self.retry_policy.delay(attempt, retry_after))
+                attempt += 1
+        finally:
+            if hasattr(body, "close"):
+                body.close()
+    
+    def _submit(self, messages):
+        """
+        Posts a chunk of PostmarkMessage objects to Postmark and returns the
+        list of per message results, in the same order as messages. A single
+        message is posted to the regular endpoint, anything more to the batch
+        endpoint. Returns None if nothing was sent.
+        
+        PostmarkMailCircuitOpenException is raised while the circuit breaker
+        is open, even with fail_silently, so the caller can fall back.
+        """
+        if len(messages) == 1:
+            url, payload = self.api_url, messages[0]
+        else:
+            url, payload = self.api_batch_url, messages
+        
+        start = time.time()
+        body = encode_body(payload)
+        post_encode.send(sender=self, batch_size=len(messages), bytes=len(body), duration=time.time() - start)
         
         if POSTMARK_TEST_MODE:
-            print 'JSON message is:\n%s' % json.dumps(message)
+            print 'JSON message is:\n%s' % (body if isinstance(body, str) else body.read())
+            if hasattr(body, "close"):
+                body.close()
             return
         
         try:
-            resp, content = http.request(self.api_url,
-                body=json.dumps(message),
-                method="POST",
-                headers={
-                    "Accept": "application/json",
-                    "Content-Type": "application/json",
-                    "X-Postmark-Server-Token": self.api_key,
-                })
-        except httplib2.HttpLib2Error:
-            if not self.fail_silently:
-                return False
-            raise
+            status, headers, content = self._request(url, body, len(messages))
+        except CircuitOpenError, e:
+            raise PostmarkMailCircuitOpenException(str(e), e)
+        except TransportError, e:
+            if self.fail_silently:
+                return
+            raise PostmarkMailSendException("Could not reach Postmark: %s" % e.parameter, e)
+        
+        if status != 200:
+            self._handle_error(status, content)
+            return
+        
+        if len(messages) == 1:
+            return [loads(content)]
+        return loads(content)
+    
+    def _process(self, messages, responses):
+        """
+        Records the results of a chunk with _record() and returns how many
+        messages Postmark accepted. The first per message error is raised
+        afterwards, so partial failures are still recorded.
+        """
+        if not responses:
+            return 0
         
-        if resp["status"] == "200":
-            post_send.send(sender=self, message=message, response=json.loads(content))
-            return True
-        elif resp["status"] == "401":
+        accepted, rejected = self._record(zip(messages, responses))
+        if rejected and not self.fail_silently:
+            raise PostmarkMailUnprocessableEntityException(responses[rejected[0]].get("Message"))
+        return len(accepted)
+    
+    def _record(self, results):
+        """
+        Takes a list of (message, response) pairs and fires post_send for
+        every message Postmark accepted, then post_send_batch once for all of
+        them and post_persist. Returns the lists of the indexes of the
+        accepted and the rejected pairs.
+        """
+        start = time.time()
+        accepted, rejected = [], []
+        for i, (message, response) in enumerate(results):
+            if response.get("ErrorCode", 0) == 0:
+                post_send.send(sender=self, message=message, response=response)
+                accepted.append(i)
+            else:
+                rejected.append(i)
+        
+        if accepted:
+            post_send_batch.send(sender=self, messages=[results[i][0] for i in accepted],
+                responses=[results[i][1] for i in accepted])
+        post_persist.send(sender=self, accepted=len(accepted), rejected=len(rejected), duration=time.time() - start)
+        return accepted, rejected
+    
+    def _handle_error(self, status, content):
+        if status == 401:
             if not self.fail_silently:
-                raise PostmarkMailUnauthorizedException("Your Postmark API Key is Invalid.")
-        elif resp["status"] == "422":
+                raise PostmarkMailUnauthorizedException("Your Postmark API Key is Invalid.", status=status)
+        elif status == 422:
             if not self.fail_silently:
-                content_dict = json.loads(content)
-                raise PostmarkMailUnprocessableEntityException(content_dict["Message"])
-        elif resp["status"] == "500":
+                content_dict = loads(content)
+                raise PostmarkMailUnprocessableEntityException(content_dict["Message"], status=status)
+        elif status >= 500:
             if not self.fail_silently:
-                PostmarkMailServerErrorException()
+                raise PostmarkMailServerErrorException("Postmark returned HTTP %d." % status, status=status)
+        elif not self.fail_silently:
+            raise PostmarkMailSendException("Postmark returned HTTP %d." % status, status=status)
+
+def log_send_error(exception, messages):
+    """
+    The default error callback of AsyncPostmarkBackend, logs the failed send
+    to the "postmark.backends" logger.
+    """
+    logger.error("Could not send %d message(s) to Postmark." % len(messages), exc_info=True)
+
+def get_error_callback(path=None):
+    """
+    Returns the function named by path or POSTMARK_ASYNC_ERROR_CALLBACK, or
+    log_send_error if neither is set.
+    """
+    path = path or POSTMARK_ASYNC_ERROR_CALLBACK
+    if not path:
+        return log_send_error
+    
+    try:
+        module_name, attr = path.rsplit(".", 1)
+        return getattr(import_module(module_name), attr)
+    except (ValueError, ImportError, AttributeError), e:
+        raise ImproperlyConfigured("Error loading Postmark error callback %s: \"%s\"" % (path, e))
+
+class AsyncPostmarkBackend(PostmarkBackend):
+    """
+    A variant of PostmarkBackend that does not wait for Postmark.
+    send_messages converts the messages, hands the batches to a worker pool
+    and returns straight away with the number of messages handed over, not
+    the number Postmark accepted. Conversion errors are still raised to the
+    caller, unless fail_silently is set, but errors while sending can no
+    longer reach it: whatever a send raises is passed, with the list of
+    PostmarkMessage objects it was sending, to error_callback on the worker
+    thread. That is POSTMARK_ASYNC_ERROR_CALLBACK by default, or else
+    log_send_error, and it is called whether fail_silently is set or not.
+    
+    This moves the requests off the calling thread, it does not make them
+    asynchronous I/O: each send holds one of the POSTMARK_ASYNC_WORKERS
+    threads for its round trips, and further sends wait for a free one.
+    Every instance in a process shares that worker pool and one transport.
+    post_send and the persistence of sent messages happen on the worker
+    threads, which close their database connection after each send.
+    """
+    
+    _shared_lock = threading.Lock()
+    _shared_pid = None
+    _shared_pool = None
+    _shared_transport = None
+    
+    def __init__(self, fail_silently=False, error_callback=None, **kwargs):
+        if kwargs.get("transport") is None:
+            kwargs["transport"] = self._get_shared()[1]
+        # Sends always raise on the workers, so error_callback sees every
+        # failure; fail_silently only applies to converting the messages
+        super(AsyncPostmarkBackend, self).__init__(fail_silently=False, **kwargs)
+        self.convert_silently = fail_silently
+        self.error_callback = error_callback or get_error_callback()
+    
+    @classmethod
+    def _get_shared(cls):
+        with cls._shared_lock:
+            if cls._shared_pid != os.getpid():
+                cls._shared_pool = ThreadPool(POSTMARK_ASYNC_WORKERS)
+                cls._shared_transport = get_transport(pool_size=max(POSTMARK_POOL_SIZE, POSTMARK_ASYNC_WORKERS))
+                cls._shared_pid = os.getpid()
+            return cls._shared_pool, cls._shared_transport
+    
+    def open(self):
+        """
+        The shared pools live for the whole process, there is nothing to open.
+        """
+        return False
+    
+    def close(self):
+        """
+        The shared pools live for the whole process, there is nothing to close.
+        """
+        pass
+    
+    def send_messages(self, email_messages):
+        """
+        Queues one or more EmailMessage objects for sending and returns the
+        number of email messages queued. That is only the number handed to the
+        workers, failures to send them are passed to error_callback.
+        """
+        if not email_messages:
+            return
+        
+        groups = self._partition(email_messages, self.convert_silently)
+        self._get_shared()[0].apply_async(self._send_in_background, (groups,))
+        return sum(len(chunk) for backend, chunks in groups for chunk in chunks)
+    
+    def _send_in_background(self, groups):
+        try:
+            self._send(groups)
+        except Exception, e:
+            try:
+                self.error_callback(e, [message for backend, chunks in groups for chunk in chunks for message in chunk])
+            except Exception:
+                logger.exception("The Postmark error callback failed.")
+        finally:
+            # Worker threads are not closed at the end of a request
+            connection.close()
+
+class QueuedPostmarkBackend(BaseEmailBackend):
+    """
+    Stores each message, converted to its Postmark JSON payload, in the
+    QueuedMessage table and returns without talking to Postmark. The queue is
+    drained by the postmark_send_queued management command, any number of
+    which may run at once.
+    """
+    
+    def send_messages(self, email_messages):
+        """
+        Queues one or more EmailMessage objects and returns the number of email
+        messages queued.
+        """
+        if not email_messages:
+            return
+        
+        queued = [QueuedMessage(payload=dumps(message)) for message in convert_messages(email_messages, self.fail_silently)]
         
-        return False
\ No newline at end of file
+        QueuedMessage.objects.bulk_create(queued)
+        return len(queued)
@@ -0,0 +1,191 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.importlib import import_module
+from django.conf import settings
+from tempfile import SpooledTemporaryFile
+import mimetypes
+import hashlib
+import base64
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+# Settings
+POSTMARK_SPOOL_SIZE = getattr(settings, "POSTMARK_SPOOL_SIZE", 1024 * 1024)
+POSTMARK_ATTACHMENT_MAX_SIZE = getattr(settings, "POSTMARK_ATTACHMENT_MAX_SIZE", 10 * 1024 * 1024)
+POSTMARK_ATTACHMENT_STORAGE = getattr(settings, "POSTMARK_ATTACHMENT_STORAGE", "content")
+POSTMARK_JSON_ENCODER = getattr(settings, "POSTMARK_JSON_ENCODER", "json.dumps")
+POSTMARK_JSON_DECODER = getattr(settings, "POSTMARK_JSON_DECODER", "json.loads")
+
+# A multiple of 3 bytes, so consecutive base64 chunks join without padding
+CHUNK_SIZE = 3 * 16 * 1024
+
+class PostmarkAttachment(object):
+    """
+    An attachment of a PostmarkMessage. The content is kept as raw bytes and
+    only base64 encoded while it is written out, see encode_body.
+    """
+
+    def __init__(self, name, content, content_type=None):
+        if isinstance(content, unicode):
+            content = content.encode("utf-8")
+
+        self.name = name
+        self.content = content
+        self.content_type = content_type or mimetypes.guess_type(name or "")[0] or "application/octet-stream"
+
+    @classmethod
+    def from_django(cls, attachment):
+        """
+        Takes an entry of a Django EmailMessage's attachments, either a
+        (filename, content, mimetype) tuple or a MIMEBase instance.
+        """
+        if isinstance(attachment, (tuple, list)):
+            return cls(*attachment)
+        return cls(attachment.get_filename(), attachment.get_payload(decode=True), attachment.get_content_type())
+
+    def __len__(self):
+        return len(self.content)
+
+    def to_dict(self):
+        return {"Name": self.name, "Content": base64.b64encode(self.content), "ContentType": self.content_type}
+
+    def metadata(self):
+        return {"Name": self.name, "ContentType": self.content_type, "Size": len(self.content), "Hash": hashlib.sha1(self.content).hexdigest()}
+
+    def write_json(self, out):
+        out.write('{"Name": %s, "ContentType": %s, "Content": "' % (json.dumps(self.name), json.dumps(self.content_type)))
+        for i in xrange(0, len(self.content), CHUNK_SIZE):
+            out.write(base64.b64encode(self.content[i:i + CHUNK_SIZE]))
+        out.write('"}')
+
+def _load_callable(path, setting):
+    try:
+        module_name, attr = path.rsplit(".", 1)
+        return getattr(import_module(module_name), attr)
+    except (ImportError, AttributeError, ValueError), e:
+        raise ImproperlyConfigured("Error importing %s %s: \"%s\"" % (setting, path, e))
+
+_codec = {}
+
+def _get_codec(name, path):
+    func = _codec.get(name)
+    if func is None:
+        func = _codec[name] = _load_callable(path, name)
+    return func
+
+def _plain(obj):
+    if hasattr(obj, "to_dict"):
+        return obj.to_dict()
+    if isinstance(obj, (list, tuple)):
+        return [_plain(item) for item in obj]
+    return obj
+
+def dumps(obj):
+    """
+    Serializes a PostmarkMessage, a PostmarkAttachment, a plain payload or a
+    list of any of them with the function named by POSTMARK_JSON_ENCODER.
+    Objects are turned into plain dicts first, so any json.dumps compatible
+    function can be used.
+    """
+    return _get_codec("POSTMARK_JSON_ENCODER", POSTMARK_JSON_ENCODER)(_plain(obj))
+
+def loads(value):
+    """
+    Parses a JSON string with the function named by POSTMARK_JSON_DECODER.
+    """
+    return _get_codec("POSTMARK_JSON_DECODER", POSTMARK_JSON_DECODER)(value)
+
+class SpooledBody(object):
+    """
+    A request body that is kept in memory up to POSTMARK_SPOOL_SIZE bytes and
+    spills over to a temporary file beyond that. Reading to the end rewinds
+    it, so the HTTP library can send it again when it retries a request.
+    """
+
+    def __init__(self):
+        self._file = SpooledTemporaryFile(POSTMARK_SPOOL_SIZE)
+        self._length = 0
+
+    def write(self, data):
+        self._file.write(data)
+        self._length += len(data)
+
+    def read(self, size=-1):
+        data = self._file.read(size)
+        if not data:
+            self._file.seek(0)
+        return data
+
+    def seek(self, offset, whence=0):
+        self._file.seek(offset, whence)
+
+    def close(self):
+        self._file.close()
+
+    def __len__(self):
+        return self._length
+
+def _has_attachments(payload):
+    if isinstance(payload, (list, tuple)):
+        return any(_has_attachments(message) for message in payload)
+    return bool(payload.get("Attachments"))
+
+def _write_json(out, value):
+    if isinstance(value, PostmarkAttachment):
+        value.write_json(out)
+    elif isinstance(value, dict) or hasattr(value, "iteritems"):
+        out.write("{")
+        for i, (key, item) in enumerate(value.iteritems()):
+            if i:
+                out.write(", ")
+            out.write(dumps(key))
+            out.write(": ")
+            _write_json(out, item)
+        out.write("}")
+    elif isinstance(value, (list, tuple)):
+        out.write("[")
+        for i, item in enumerate(value):
+            if i:
+                out.write(", ")
+            _write_json(out, item)
+        out.write("]")
+    else:
+        out.write(dumps(value))
+
+def encode_body(payload):
+    """
+    Returns the JSON request body for a message or a list of messages. A
+    payload without attachments is returned as a string. Otherwise a
+    SpooledBody is returned with every attachment base64 encoded straight
+    into it chunk by chunk, so no further full copy of the attachment data
+    is held in memory.
+    """
+    if not _has_attachments(payload):
+        body = dumps(payload)
+        if isinstance(body, unicode):
+            body = body.encode("utf-8")
+        return body
+
+    body = SpooledBody()
+    _write_json(body, payload)
+    body.seek(0)
+    return body
+
+def stored_attachments(attachments):
+    """
+    Returns what is recorded for a sent message's attachments, depending on
+    POSTMARK_ATTACHMENT_STORAGE: their full content ("content"), only their
+    name, type, size and hash ("metadata"), or nothing ("none").
+    """
+    if not attachments or POSTMARK_ATTACHMENT_STORAGE == "none":
+        return u""
+
+    if POSTMARK_ATTACHMENT_STORAGE == "metadata":
+        return dumps([
+            (attachment if isinstance(attachment, PostmarkAttachment) else
+                PostmarkAttachment(attachment["Name"], base64.b64decode(attachment["Content"]), attachment["ContentType"])).metadata()
+            for attachment in attachments
+        ])
+    return dumps(attachments)
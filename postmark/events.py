@@ -0,0 +1,97 @@
+from __future__ import with_statement
+
+from django.db import connection, transaction
+from django.conf import settings
+import threading
+import logging
+import atexit
+import os
+
+from postmark.models import EmailEvent
+
+# Settings
+POSTMARK_EVENT_BUFFER_SIZE = getattr(settings, "POSTMARK_EVENT_BUFFER_SIZE", 500)
+POSTMARK_EVENT_FLUSH_INTERVAL = getattr(settings, "POSTMARK_EVENT_FLUSH_INTERVAL", 1.0)
+
+logger = logging.getLogger("postmark.events")
+
+class EventBuffer(object):
+    """
+    Collects EmailEvent objects in process memory and writes them with bulk
+    inserts of up to size rows: as soon as size events are waiting, from the
+    thread that added the last one, and otherwise every interval seconds from
+    a background thread. What is left is written when the process exits.
+
+    add() and flush() are safe to call from any number of threads. Events
+    still buffered when a process is killed outright are lost, and a failed
+    write is logged and dropped rather than retried.
+    """
+
+    def __init__(self, size=None, interval=None):
+        self.size = max(size or POSTMARK_EVENT_BUFFER_SIZE, 1)
+        self.interval = interval if interval is not None else POSTMARK_EVENT_FLUSH_INTERVAL
+        self._lock = threading.Lock()
+        self._events = []
+        self._pid = None
+        self._closed = threading.Event()
+
+    def add(self, events):
+        """
+        Buffers a list of unsaved EmailEvent objects.
+        """
+        with self._lock:
+            self._start()
+            self._events.extend(events)
+            full = len(self._events) >= self.size
+        if full:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes every buffered event and returns how many there were.
+        """
+        with self._lock:
+            events, self._events = self._events, []
+        for i in xrange(0, len(events), self.size):
+            self._write(events[i:i + self.size])
+        return len(events)
+
+    def close(self):
+        """
+        Stops the background thread and writes every buffered event. Later
+        events are only written once size of them are waiting.
+        """
+        self._closed.set()
+        self.flush()
+
+    def _write(self, events):
+        try:
+            with transaction.commit_on_success():
+                EmailEvent.objects.bulk_create(events)
+        except Exception:
+            logger.exception("Could not write %d Postmark event(s)." % len(events))
+
+    def _start(self):
+        # Called with the lock held. Threads do not survive a fork, so a child
+        # process starts a flusher of its own and drops its parent's events.
+        if self._pid == os.getpid():
+            return
+        if self._pid is not None:
+            self._events = []
+        self._pid = os.getpid()
+
+        thread = threading.Thread(target=self._run, name="postmark-event-flusher")
+        thread.daemon = True
+        thread.start()
+
+    def _run(self):
+        pid = os.getpid()
+        while self._pid == pid and not self._closed.wait(self.interval):
+            if self.flush():
+                # The thread's own connection is not closed by any request
+                connection.close()
+
+buffer = EventBuffer()
+
+# Daemon threads are stopped without warning at exit, write what they hold.
+atexit.register(buffer.close)
@@ -0,0 +1,259 @@
+import binascii
+import tempfile
+import re
+
+# Bytes read from the request at a time
+CHUNK_SIZE = 64 * 1024
+
+_SPECIAL = re.compile(r'["\\]')
+_DELIMITER = re.compile(r'[,}\]\s]')
+_LITERAL = re.compile(r'true|false|null|-?\d+(\.\d+)?([eE][-+]?\d+)?')
+_CONSTANTS = {"true": True, "false": False, "null": None}
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+_WHITESPACE = " \t\r\n"
+
+class JSONStreamError(ValueError):
+    """
+    Raised by StreamParser on malformed or truncated JSON.
+    """
+    pass
+
+class StreamParser(object):
+    """
+    A pull parser reading JSON from a file-like object CHUNK_SIZE bytes at a
+    time. value() returns the next value whole, while iter_object(),
+    iter_array() and iter_string() walk it piece by piece, so a caller can
+    stream a large string instead of holding it in memory.
+    """
+
+    def __init__(self, fp, chunk_size=CHUNK_SIZE):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        data = self.fp.read(self.chunk_size)
+        if not data:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def _ensure(self, size):
+        while len(self.buffer) - self.pos < size:
+            if not self._fill():
+                raise JSONStreamError("Unexpected end of data.")
+
+    def _peek(self):
+        """
+        Skips whitespace and returns the next character, "" at the end.
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, char):
+        found = self._peek()
+        if found != char:
+            raise JSONStreamError("Expected %r, found %r." % (char, found or "end of data"))
+        self.pos += 1
+
+    def value(self):
+        char = self._peek()
+        if char == "{":
+            return dict((key, self.value()) for key in self.iter_object())
+        if char == "[":
+            return [self.value() for item in self.iter_array()]
+        if char == '"':
+            return self.string()
+        return self._literal()
+
+    def string(self):
+        return "".join(self.iter_string()).decode("utf-8")
+
+    def iter_object(self):
+        """
+        Yields the keys of the object at the current position. Each value has
+        to be read, with any of the parser's methods, before the next key.
+        """
+        self._expect("{")
+        if self._peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.string()
+            self._expect(":")
+            yield key
+            if not self._next_item("}"):
+                return
+
+    def iter_array(self):
+        """
+        Yields once per item of the array at the current position. Each item
+        has to be read, with any of the parser's methods, before the next one.
+        """
+        self._expect("[")
+        if self._peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield None
+            if not self._next_item("]"):
+                return
+
+    def _next_item(self, closing):
+        char = self._peek()
+        self.pos += 1
+        if char == ",":
+            return True
+        if char == closing:
+            return False
+        raise JSONStreamError("Expected ',' or %r, found %r." % (closing, char or "end of data"))
+
+    def iter_string(self):
+        """
+        Yields the string at the current position in pieces of UTF-8 encoded
+        bytes, with escapes resolved. A piece may end in the middle of a
+        multibyte character.
+        """
+        self._expect('"')
+        while True:
+            match = _SPECIAL.search(self.buffer, self.pos)
+            if match is None:
+                if self.pos < len(self.buffer):
+                    yield self.buffer[self.pos:]
+                self.pos = len(self.buffer)
+                if not self._fill():
+                    raise JSONStreamError("Unterminated string.")
+                continue
+
+            if match.start() > self.pos:
+                yield self.buffer[self.pos:match.start()]
+            self.pos = match.end()
+            if match.group() == '"':
+                return
+            yield self._escape()
+
+    def _escape(self):
+        self._ensure(1)
+        char = self.buffer[self.pos]
+        self.pos += 1
+        if char != "u":
+            try:
+                return _ESCAPES[char]
+            except KeyError:
+                raise JSONStreamError("Invalid escape \\%s." % char)
+
+        code = self._hex()
+        if 0xd800 <= code < 0xdc00:
+            # A high surrogate may also be the last thing in the data
+            while len(self.buffer) - self.pos < 6 and self._fill():
+                pass
+            if self.buffer[self.pos:self.pos + 2] == "\\u":
+                self.pos += 2
+                low = self._hex()
+                if not 0xdc00 <= low < 0xe000:
+                    raise JSONStreamError("Invalid surrogate pair.")
+                code = 0x10000 + ((code - 0xd800) << 10) + (low - 0xdc00)
+        return ("\\U%08x" % code).decode("unicode-escape").encode("utf-8")
+
+    def _hex(self):
+        self._ensure(4)
+        digits = self.buffer[self.pos:self.pos + 4]
+        self.pos += 4
+        try:
+            return int(digits, 16)
+        except ValueError:
+            raise JSONStreamError("Invalid escape \\u%s." % digits)
+
+    def _literal(self):
+        self._peek()
+        while not self.eof and not _DELIMITER.search(self.buffer, self.pos):
+            self._fill()
+        match = _LITERAL.match(self.buffer, self.pos)
+        if match is None:
+            raise JSONStreamError("Unexpected %r." % (self.buffer[self.pos:self.pos + 10] or "end of data"))
+        self.pos = match.end()
+
+        token = match.group()
+        if token in _CONSTANTS:
+            return _CONSTANTS[token]
+        if match.group(1) or match.group(2):
+            return float(token)
+        return int(token)
+
+class Base64Writer(object):
+    """
+    Decodes base64 written to it in pieces of any size into fp, counting the
+    decoded bytes in size.
+    """
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.size = 0
+        self._pending = ""
+
+    def write(self, data):
+        data = self._pending + data.translate(None, _WHITESPACE)
+        end = len(data) - len(data) % 4
+        self._pending = data[end:]
+        self._decode(data[:end])
+
+    def close(self):
+        if self._pending:
+            self._decode(self._pending + "=" * (-len(self._pending) % 4))
+            self._pending = ""
+
+    def _decode(self, data):
+        if not data:
+            return
+        try:
+            decoded = binascii.a2b_base64(data)
+        except binascii.Error, e:
+            raise JSONStreamError("Invalid attachment content: %s" % e)
+        self.fp.write(decoded)
+        self.size += len(decoded)
+
+def parse_inbound(fp, save_attachment, chunk_size=CHUNK_SIZE):
+    """
+    Reads an inbound hook payload from fp and returns its fields as a dict.
+    The content of each attachment is decoded into a temporary file as it is
+    read; save_attachment(fields, content, size) is then called with the
+    attachment's other fields, that file and its size, and the "Attachments"
+    of the result list what it returned. Only one attachment is held at a
+    time, on disk.
+    """
+    parser = StreamParser(fp, chunk_size)
+    payload = {}
+    for key in parser.iter_object():
+        if key == "Attachments" and parser._peek() == "[":
+            payload[key] = [_parse_attachment(parser, save_attachment) for item in parser.iter_array()]
+        else:
+            payload[key] = parser.value()
+    if parser._peek():
+        raise JSONStreamError("Unexpected data after the payload.")
+    return payload
+
+def _parse_attachment(parser, save_attachment):
+    fields = {}
+    content = tempfile.TemporaryFile()
+    try:
+        writer = Base64Writer(content)
+        for key in parser.iter_object():
+            if key == "Content" and parser._peek() == '"':
+                for piece in parser.iter_string():
+                    writer.write(piece)
+                writer.close()
+            else:
+                fields[key] = parser.value()
+        content.seek(0)
+        return save_attachment(fields, content, writer.size)
+    finally:
+        content.close()
@@ -0,0 +1,62 @@
+from __future__ import with_statement
+
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+from optparse import make_option
+import time
+
+from postmark.models import BounceInbox, EmailBounce, bounce_payloads
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+class Command(NoArgsCommand):
+    help = "Ingests the bounce hook payloads stored in the BounceInbox table in batches."
+
+    option_list = NoArgsCommand.option_list + (
+        make_option("--batch-size", type="int", dest="batch_size", default=500,
+            help="Number of stored payloads to claim and ingest at once."),
+        make_option("--lease", type="int", dest="lease", default=300,
+            help="Seconds after which a claimed batch that was not ingested is retried."),
+        make_option("--loop", action="store_true", dest="loop", default=False,
+            help="Keep polling the inbox instead of exiting once it is empty."),
+        make_option("--sleep", type="float", dest="sleep", default=1.0,
+            help="Seconds to wait between polls of an empty inbox with --loop."),
+    )
+
+    def handle_noargs(self, **options):
+        num_created = 0
+        while True:
+            rows = BounceInbox.objects.claim(options["batch_size"], options["lease"])
+            if not rows:
+                if not options["loop"]:
+                    break
+                time.sleep(options["sleep"])
+                continue
+            num_created += self.process_batch(rows)
+
+        if int(options["verbosity"]) > 0:
+            self.stdout.write("Stored %d new bounce(s).\n" % num_created)
+
+    def process_batch(self, rows):
+        """
+        Ingests one claimed batch of payloads and returns the number of
+        bounces created. Payloads that are not valid JSON, or not bounces, are
+        marked as failed and kept for inspection.
+        """
+        bounces, processed = [], []
+        for row in rows:
+            try:
+                bounces.extend(bounce_payloads(json.loads(row.payload)))
+            except ValueError, e:
+                BounceInbox.objects.filter(pk=row.pk).update(failed=True, last_error=str(e))
+                continue
+            processed.append(row.pk)
+
+        with transaction.commit_on_success():
+            created = EmailBounce.objects.ingest(bounces)
+            BounceInbox.objects.filter(id__in=processed).delete()
+
+        return len(created)
@@ -0,0 +1,165 @@
+from __future__ import with_statement
+
+from django.core.management.base import NoArgsCommand, CommandError
+from django.utils.timezone import now as tz_now
+from django.db import transaction
+from optparse import make_option
+from datetime import timedelta
+import gzip
+import time
+import os
+
+from postmark.encoding import dumps
+from postmark.models import EmailMessage, EmailBounce, EmailContent, SyncCursor
+
+# The last message archived of a chunk that is not deleted yet, so a run that
+# fails in between does not archive it twice
+ARCHIVE_CURSOR_NAME = "purge_archive"
+
+class Command(NoArgsCommand):
+    help = ("Deletes, and optionally archives, EmailMessage rows and their bounces older than --days, and "
+        "compresses the content of messages older than --compress-days. Works in small chunks and can be "
+        "stopped and run again at any time.")
+
+    option_list = NoArgsCommand.option_list + (
+        make_option("--days", type="int", dest="days", default=None,
+            help="Delete messages submitted more than this many days ago."),
+        make_option("--compress-days", type="int", dest="compress_days", default=None,
+            help="Compress the content of messages submitted more than this many days ago."),
+        make_option("--archive-dir", dest="archive_dir", default=None,
+            help="Append deleted messages and their bounces to gzipped JSON lines files in this directory."),
+        make_option("--chunk-size", type="int", dest="chunk_size", default=1000,
+            help="Largest number of rows handled per transaction."),
+        make_option("--chunk-time", type="float", dest="chunk_time", default=1.0,
+            help="Seconds a chunk should take, the chunk size shrinks or grows to match."),
+        make_option("--sleep", type="float", dest="sleep", default=0.5,
+            help="Seconds to pause between chunks."),
+    )
+
+    def handle_noargs(self, **options):
+        if options["days"] is None and options["compress_days"] is None:
+            raise CommandError("Pass --days, --compress-days or both.")
+        if options["archive_dir"] and not os.path.isdir(options["archive_dir"]):
+            raise CommandError("%s is not a directory." % options["archive_dir"])
+
+        self.options = options
+        verbose = int(options["verbosity"]) > 0
+
+        if options["compress_days"] is not None:
+            cutoff = tz_now() - timedelta(days=options["compress_days"])
+            num_compressed = self.run_chunks(lambda last_id, size: self.compress_chunk(cutoff, last_id, size))
+            if verbose:
+                self.stdout.write("Compressed %d content row(s).\n" % num_compressed)
+
+        if options["days"] is not None:
+            cutoff = tz_now() - timedelta(days=options["days"])
+            archive = None
+            if options["archive_dir"]:
+                archive = os.path.join(options["archive_dir"], "postmark-messages-%s.jsonl.gz" % cutoff.strftime("%Y%m%d"))
+            num_deleted = self.run_chunks(lambda last_id, size: self.purge_chunk(cutoff, archive, last_id, size))
+            if verbose:
+                self.stdout.write("Deleted %d message(s)%s.\n" % (num_deleted, " to %s" % archive if archive else ""))
+
+    def run_chunks(self, handle_chunk):
+        """
+        Calls handle_chunk(last_id, size) until it returns no ids, adapting
+        size so a chunk takes about --chunk-time seconds, and pausing --sleep
+        seconds in between. Returns the total number of rows handled.
+        """
+        max_size = self.options["chunk_size"]
+        size = max_size
+        last_id = 0
+        total = 0
+        while True:
+            start = time.time()
+            ids = handle_chunk(last_id, size)
+            if not ids:
+                return total
+            elapsed = time.time() - start
+
+            total += len(ids)
+            last_id = max(ids)
+            if elapsed > self.options["chunk_time"]:
+                size = max(size // 2, 1)
+            elif elapsed < self.options["chunk_time"] / 2:
+                size = min(size * 2, max_size)
+
+            if int(self.options["verbosity"]) > 1:
+                self.stdout.write("%d row(s) up to id %d in %.2fs.\n" % (len(ids), last_id, elapsed))
+            time.sleep(self.options["sleep"])
+
+    def compress_chunk(self, cutoff, last_id, size):
+        ids = list(EmailContent.objects.filter(id__gt=last_id, compressed=False, messages__submitted_at__lt=cutoff)
+            .order_by("id").distinct().values_list("id", flat=True)[:size])
+
+        with transaction.commit_on_success():
+            for content in EmailContent.objects.filter(id__in=ids, compressed=False):
+                content.compress()
+                content.save()
+        return ids
+
+    def purge_chunk(self, cutoff, archive, last_id, size):
+        ids = list(EmailMessage.objects.filter(id__gt=last_id, submitted_at__lt=cutoff)
+            .order_by("id").values_list("id", flat=True)[:size])
+        if not ids:
+            return ids
+
+        if archive is not None:
+            # A chunk archived by an earlier run that failed to delete it is
+            # only deleted now
+            cursor, is_new = SyncCursor.objects.get_or_create(name=ARCHIVE_CURSOR_NAME, defaults={"value": "0"})
+            archive_ids = [pk for pk in ids if pk > int(cursor.value)]
+            if archive_ids:
+                self.archive(archive, archive_ids)
+                cursor.value = str(archive_ids[-1])
+                cursor.save()
+
+        with transaction.commit_on_success():
+            content_ids = set(EmailMessage.objects.filter(id__in=ids).values_list("content_id", flat=True))
+            # Waits for sends that picked up this content to store their
+            # messages, see EmailContentManager.for_hashes
+            content_ids = list(EmailContent.objects.select_for_update().filter(id__in=content_ids - set([None]))
+                .order_by("id").values_list("id", flat=True))
+            EmailBounce.objects.filter(message__in=ids).delete()
+            EmailMessage.objects.filter(id__in=ids).delete()
+            EmailContent.objects.filter(id__in=content_ids, messages__isnull=True).delete()
+            if archive is not None:
+                # Ids may be reused once deleted, on SQLite for one
+                SyncCursor.objects.filter(name=ARCHIVE_CURSOR_NAME).update(value="0")
+        return ids
+
+    def archive(self, path, ids):
+        """
+        Appends the messages with the given ids, with their content and
+        bounces, to path as one JSON object per line. Each chunk is written as
+        a gzip member of its own, so a run that is interrupted leaves every
+        earlier chunk readable.
+        """
+        bounces = {}
+        for bounce in EmailBounce.objects.filter(message__in=ids).order_by("id").values():
+            bounce["bounced_at"] = bounce["bounced_at"].isoformat()
+            bounces.setdefault(bounce.pop("message_id"), []).append(bounce)
+
+        archive = gzip.open(path, "ab")
+        try:
+            for message in EmailMessage.objects.filter(id__in=ids).select_related("content").order_by("id"):
+                archive.write(dumps({
+                    "id": message.pk,
+                    "message_id": message.message_id,
+                    "submitted_at": message.submitted_at.isoformat(),
+                    "status": message.status,
+                    "to": message.to,
+                    "to_type": message.to_type,
+                    "sender": message.sender,
+                    "reply_to": message.reply_to,
+                    "subject": message.subject,
+                    "tag": message.tag,
+                    "text_body": message.text_body,
+                    "html_body": message.html_body,
+                    "headers": message.headers,
+                    "attachments": message.attachments,
+                    "bounces": bounces.get(message.pk, []),
+                }))
+                archive.write("\n")
+        finally:
+            archive.close()
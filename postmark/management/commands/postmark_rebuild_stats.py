@@ -0,0 +1,68 @@
+from __future__ import with_statement
+
+from django.core.management.base import NoArgsCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+from django.conf import settings
+from optparse import make_option
+from datetime import datetime, timedelta
+import pytz
+
+from postmark.models import EmailMessage, EmailBounce, DeliveryStat, utc_day
+
+class Command(NoArgsCommand):
+    help = ("Rebuilds the DeliveryStat rollups from the EmailMessage and EmailBounce rows, one UTC day per "
+        "transaction. Days whose messages were deleted by postmark_purge are rebuilt from what is left, so "
+        "pass --since to keep the figures of older days.")
+
+    option_list = NoArgsCommand.option_list + (
+        make_option("--since", dest="since", default=None,
+            help="Rebuild the days from this one (YYYY-MM-DD, UTC) on, instead of every day."),
+    )
+
+    def handle_noargs(self, **options):
+        if options["since"]:
+            try:
+                since = datetime.strptime(options["since"], "%Y-%m-%d").date()
+            except ValueError:
+                raise CommandError("--since must be a date as YYYY-MM-DD.")
+        else:
+            first = list(EmailMessage.objects.order_by("submitted_at").values_list("submitted_at", flat=True)[:1])
+            if not first:
+                DeliveryStat.objects.all().delete()
+                return
+            since = utc_day(first[0])
+            DeliveryStat.objects.filter(day__lt=since).delete()
+
+        last = list(EmailMessage.objects.order_by("-submitted_at").values_list("submitted_at", flat=True)[:1])
+        until = max(utc_day(last[0]), since) if last else since
+        DeliveryStat.objects.filter(day__gt=until).delete()
+
+        day = since
+        while day <= until:
+            num_rows = self.rebuild_day(day)
+            if int(options["verbosity"]) > 1:
+                self.stdout.write("%s: %d row(s).\n" % (day, num_rows))
+            day += timedelta(days=1)
+
+    def rebuild_day(self, day):
+        start = datetime.combine(day, datetime.min.time())
+        if settings.USE_TZ:
+            start = start.replace(tzinfo=pytz.utc)
+        end = start + timedelta(days=1)
+
+        counts = {}
+        for row in (EmailMessage.objects.filter(submitted_at__gte=start, submitted_at__lt=end)
+                .values("tag", "status").annotate(num=Count("id")).order_by()):
+            counts.setdefault((row["tag"], row["status"], ""), [0, 0])[0] += row["num"]
+        for row in (EmailBounce.objects.filter(message__submitted_at__gte=start, message__submitted_at__lt=end)
+                .values("message__tag", "message__status", "type").annotate(num=Count("id")).order_by()):
+            counts.setdefault((row["message__tag"], row["message__status"], row["type"]), [0, 0])[1] += row["num"]
+
+        with transaction.commit_on_success():
+            DeliveryStat.objects.filter(day=day).delete()
+            DeliveryStat.objects.bulk_create([
+                DeliveryStat(day=day, tag=tag, status=status, bounce_type=bounce_type, sent=sent, bounced=bounced)
+                for (tag, status, bounce_type), (sent, bounced) in counts.iteritems()
+            ])
+        return len(counts)
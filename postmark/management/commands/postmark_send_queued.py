@@ -0,0 +1,105 @@
+from django.core.management.base import NoArgsCommand
+from django.db.models import F
+from optparse import make_option
+import time
+
+from postmark.backends import PostmarkBackend, PostmarkMailSendException, PostmarkMailCircuitOpenException
+from postmark.encoding import loads
+from postmark.models import QueuedMessage
+
+class Command(NoArgsCommand):
+    help = "Sends the messages queued by QueuedPostmarkBackend to Postmark in batches."
+
+    option_list = NoArgsCommand.option_list + (
+        make_option("--batch-size", type="int", dest="batch_size", default=PostmarkBackend.BATCH_SIZE,
+            help="Number of queued messages to claim and send per request."),
+        make_option("--lease", type="int", dest="lease", default=300,
+            help="Seconds after which a claimed batch that was not sent is retried."),
+        make_option("--max-attempts", type="int", dest="max_attempts", default=5,
+            help="Number of attempts after which a message is marked as failed."),
+        make_option("--loop", action="store_true", dest="loop", default=False,
+            help="Keep polling the queue instead of exiting once it is empty."),
+        make_option("--sleep", type="float", dest="sleep", default=5.0,
+            help="Seconds to wait between polls of an empty queue with --loop."),
+    )
+
+    def handle_noargs(self, **options):
+        batch_size = min(options["batch_size"], PostmarkBackend.BATCH_SIZE)
+
+        backend = PostmarkBackend()
+        backend.open()
+        try:
+            num_sent = 0
+            while True:
+                breaker = backend.circuit_breaker
+                rows = [] if breaker is not None and breaker.is_open() else QueuedMessage.objects.claim(batch_size, options["lease"])
+                if not rows:
+                    if not options["loop"]:
+                        break
+                    time.sleep(options["sleep"])
+                    continue
+                num_sent += self.send_batch(backend, rows, options["max_attempts"])
+        finally:
+            backend.close()
+
+        if int(options["verbosity"]) > 0:
+            self.stdout.write("Sent %d queued message(s).\n" % num_sent)
+
+    def send_batch(self, backend, rows, max_attempts):
+        """
+        Sends one claimed batch and returns the number of messages Postmark
+        accepted. The batch is split by route, see POSTMARK_ROUTES.
+        """
+        groups = {}
+        for row in rows:
+            payload = loads(row.payload)
+            group_rows, payloads = groups.setdefault(backend.route(payload), ([], []))
+            group_rows.append(row)
+            payloads.append(payload)
+
+        return sum([self.send_group(route_backend, group_rows, payloads, max_attempts)
+            for route_backend, (group_rows, payloads) in groups.iteritems()])
+
+    def send_group(self, backend, rows, payloads, max_attempts):
+        """
+        Sends the rows of a batch that go through backend and returns the
+        number of messages Postmark accepted. Accepted rows are deleted before
+        the messages are recorded, so a failing post_send receiver can't get
+        them sent again. Rows Postmark rejected, as part of a batch or with a
+        4xx for the whole request, are marked as failed, and rows that could
+        not be sent at all stay claimed until their lease runs out. Rows are
+        released without using up an attempt while the circuit breaker is
+        open.
+        """
+        QueuedMessage.objects.filter(id__in=[row.pk for row in rows]).update(attempts=F("attempts") + 1)
+
+        try:
+            responses = backend._submit(payloads)
+        except PostmarkMailCircuitOpenException:
+            QueuedMessage.objects.filter(id__in=[row.pk for row in rows]).update(attempts=F("attempts") - 1)
+            QueuedMessage.objects.release(rows)
+            return 0
+        except PostmarkMailSendException, e:
+            # A bad server token or rate limiting is not the messages' fault
+            if e.status is not None and 400 <= e.status < 500 and e.status not in (401, 429):
+                QueuedMessage.objects.filter(id__in=[row.pk for row in rows]).update(failed=True, last_error=str(e))
+                return 0
+            responses, error = None, str(e)
+        else:
+            error = "No response from Postmark."
+
+        if responses is None:
+            exhausted = [row.pk for row in rows if row.attempts + 1 >= max_attempts]
+            QueuedMessage.objects.filter(id__in=exhausted).update(failed=True, last_error=error)
+            return 0
+
+        sent = []
+        for row, response in zip(rows, responses):
+            if response.get("ErrorCode", 0) == 0:
+                sent.append(row.pk)
+            else:
+                QueuedMessage.objects.filter(pk=row.pk).update(failed=True, last_error=response.get("Message", ""))
+        QueuedMessage.objects.filter(id__in=sent).delete()
+
+        backend._record(zip(payloads, responses))
+        return len(sent)
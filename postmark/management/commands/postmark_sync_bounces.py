@@ -0,0 +1,198 @@
+from __future__ import with_statement
+
+from django.core.management.base import NoArgsCommand, CommandError
+from django.utils.timezone import now as tz_now
+from django.db import transaction
+from multiprocessing.pool import ThreadPool
+from optparse import make_option
+from datetime import datetime, timedelta
+import urllib
+import time
+
+from postmark.backends import POSTMARK_API_KEY, POSTMARK_API_BOUNCES_URL
+from postmark.encoding import loads
+from postmark.models import EmailBounce, SyncCursor
+from postmark.resilience import RetryPolicy, get_rate_limiter, parse_retry_after
+from postmark.transports import TransportError, get_transport
+
+CURSOR_NAME = "bounces"
+
+# Postmark serves at most this many bounces per page, and no further than
+# MAX_OFFSET into a single query.
+MAX_PAGE_SIZE = 500
+MAX_OFFSET = 10000
+
+class Command(NoArgsCommand):
+    help = ("Fetches bounces from Postmark's bounces API and stores the ones that are missing, as if they had "
+        "been posted to the bounce hook. Works one day at a time, fetching the pages of a day concurrently and "
+        "splitting days with more bounces than Postmark serves of one query into shorter time windows, and "
+        "remembers the last day synced so the next run carries on from there.")
+
+    option_list = NoArgsCommand.option_list + (
+        make_option("--since", dest="since", default=None,
+            help="Sync from this day (YYYY-MM-DD) on instead of from the last day synced. Required on the first run."),
+        make_option("--until", dest="until", default=None,
+            help="Sync up to and including this day (YYYY-MM-DD), today by default."),
+        make_option("--page-size", type="int", dest="page_size", default=MAX_PAGE_SIZE,
+            help="Number of bounces requested per page, at most %d." % MAX_PAGE_SIZE),
+        make_option("--concurrency", type="int", dest="concurrency", default=4,
+            help="Number of pages fetched at once."),
+        make_option("--api-key", dest="api_key", default=None,
+            help="Server token to use instead of POSTMARK_API_KEY."),
+        make_option("--api-url", dest="api_url", default=None,
+            help="Bounces API url to use instead of Postmark's, e.g. a local stand-in."),
+    )
+
+    def handle_noargs(self, **options):
+        self.api_key = options["api_key"] or POSTMARK_API_KEY
+        if not self.api_key:
+            raise CommandError("POSTMARK_API_KEY must be set in Django settings file or passed with --api-key.")
+        self.api_url = options["api_url"] or POSTMARK_API_BOUNCES_URL
+        self.page_size = max(1, min(options["page_size"], MAX_PAGE_SIZE))
+        self.verbosity = int(options["verbosity"])
+
+        since = self.parse_day(options["since"], "--since")
+        if since is None:
+            try:
+                since = self.parse_day(SyncCursor.objects.get(name=CURSOR_NAME).value, "The stored cursor")
+            except SyncCursor.DoesNotExist:
+                raise CommandError("Nothing has been synced yet, pass --since.")
+        until = self.parse_day(options["until"], "--until") or tz_now().date()
+
+        concurrency = max(options["concurrency"], 1)
+        self.retry_policy = RetryPolicy()
+        self.rate_limiter = get_rate_limiter(self.api_key)
+        self.transport = get_transport(pool_size=concurrency)
+        self.transport.open()
+        self.pool = ThreadPool(concurrency)
+        try:
+            num_fetched = num_created = 0
+            day = since
+            while day <= until:
+                fetched, created = self.sync_day(day)
+                num_fetched += fetched
+                num_created += created
+
+                # The last day synced is fetched again by the next run, in case
+                # more bounces came in for it after this one.
+                cursor, is_new = SyncCursor.objects.get_or_create(name=CURSOR_NAME, defaults={"value": day.isoformat()})
+                if not is_new:
+                    cursor.value = day.isoformat()
+                    cursor.save()
+                if self.verbosity > 1:
+                    self.stdout.write("%s: fetched %d bounce(s), stored %d.\n" % (day, fetched, created))
+                day += timedelta(days=1)
+        finally:
+            self.pool.close()
+            self.pool.join()
+            self.transport.close()
+
+        if self.verbosity > 0:
+            self.stdout.write("Fetched %d bounce(s), stored %d new one(s).\n" % (num_fetched, num_created))
+
+    def parse_day(self, value, name):
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value, "%Y-%m-%d").date()
+        except ValueError:
+            raise CommandError("%s must be a date as YYYY-MM-DD." % name)
+
+    def sync_day(self, day):
+        """
+        Fetches and ingests every bounce of one day and returns the numbers of
+        bounces fetched and stored.
+        
+        Postmark reads fromdate and todate in its own timezone, US Eastern
+        time, which is behind UTC, so the bounces of a UTC day run into the
+        day before there. The window starts a day early to cover them; each
+        day is then fetched twice, and the bounces already stored are skipped.
+        """
+        start = datetime.combine(day - timedelta(days=1), datetime.min.time())
+        return self.sync_window(start, start + timedelta(days=2) - timedelta(seconds=1))
+
+    def sync_window(self, start, end):
+        """
+        Fetches and ingests every bounce from start to end, both inclusive, and
+        returns the numbers of bounces fetched and stored. The first page gives
+        the total, the rest are fetched concurrently and ingested as they
+        arrive. Pages shift when bounces come in meanwhile, so pages past the
+        original total are fetched as long as the total grows.
+
+        Postmark serves no more than MAX_OFFSET bounces of one query, so
+        windows holding more are split in halves down to a single second.
+        """
+        first = self.fetch(start, end, 0)
+        total = first["TotalCount"]
+        num_fetched, num_created = len(first["Bounces"]), self.ingest(first["Bounces"])
+
+        fetched = set([0])
+        while total <= MAX_OFFSET:
+            offsets = [offset for offset in xrange(0, total, self.page_size) if offset not in fetched]
+            if not offsets:
+                return num_fetched, num_created
+            fetched.update(offsets)
+            for page in self.pool.imap_unordered(lambda offset: self.fetch(start, end, offset), offsets):
+                total = max(total, page["TotalCount"])
+                num_fetched += len(page["Bounces"])
+                num_created += self.ingest(page["Bounces"])
+
+        # Bounces already stored are skipped when the halves fetch them again
+        seconds = (end - start).days * 86400 + (end - start).seconds
+        if not seconds:
+            raise CommandError("Postmark has %d bounces at %s, more than the %d it serves of one query."
+                % (total, start.isoformat(), MAX_OFFSET))
+        if self.verbosity > 1:
+            self.stdout.write("%s to %s: %d bounces, splitting.\n" % (start.isoformat(), end.isoformat(), total))
+        middle = start + timedelta(seconds=seconds // 2)
+        for window in ((start, middle), (middle + timedelta(seconds=1), end)):
+            fetched, created = self.sync_window(*window)
+            num_fetched += fetched
+            num_created += created
+        return num_fetched, num_created
+
+    def ingest(self, bounces):
+        if not bounces:
+            return 0
+        with transaction.commit_on_success():
+            return len(EmailBounce.objects.ingest(bounces))
+
+    def fetch(self, start, end, offset):
+        """
+        Returns one page of the bounces API for the bounces from start to end,
+        retrying as the retry policy allows. Fetching is idempotent, so any
+        failure may be retried.
+        """
+        if start.time() == datetime.min.time() and end.time() == datetime.max.time().replace(microsecond=0):
+            fromdate, todate = start.date().isoformat(), end.date().isoformat()
+        else:
+            fromdate, todate = start.isoformat(), end.isoformat()
+        url = "%s?%s" % (self.api_url, urllib.urlencode([
+            ("count", min(self.page_size, MAX_OFFSET - offset)),
+            ("offset", offset),
+            ("fromdate", fromdate),
+            ("todate", todate),
+        ]))
+        headers = {
+            "Accept": "application/json",
+            "X-Postmark-Server-Token": self.api_key,
+        }
+
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            try:
+                status, response_headers, content = self.transport.request(url, None, headers, method="GET")
+            except TransportError, e:
+                if not self.retry_policy.should_retry(attempt, error=e, idempotent=True):
+                    raise CommandError("Could not reach Postmark: %s" % e.parameter)
+                retry_after = None
+            else:
+                if status == 200:
+                    return loads(content)
+                retry_after = parse_retry_after(response_headers.get("retry-after"))
+                if not self.retry_policy.should_retry(attempt, status, retry_after, idempotent=True):
+                    raise CommandError("Postmark returned HTTP %d: %s" % (status, content[:200]))
+            time.sleep(self.retry_policy.delay(attempt, retry_after))
+            attempt += 1
@@ -0,0 +1,141 @@
+from __future__ import with_statement
+
+from django.conf import settings
+import threading
+import bisect
+
+from postmark import signals
+
+# Settings
+POSTMARK_METRICS = getattr(settings, "POSTMARK_METRICS", False)
+
+TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (1, 10, 50, 100, 250, 500)
+CIRCUIT_STATES = {"closed": 0, "half-open": 1, "open": 2}
+
+class Metrics(object):
+    """
+    Thread-safe counters, gauges and histograms kept in process memory and
+    rendered in the Prometheus text exposition format. Every process keeps
+    its own figures.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._types = {}
+            self._values = {}
+            self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.iteritems())))
+        with self._lock:
+            self._types.setdefault(name, "counter")
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.iteritems())))
+        with self._lock:
+            self._types.setdefault(name, "gauge")
+            self._values[key] = value
+
+    def observe(self, name, value, buckets=TIME_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.iteritems())))
+        with self._lock:
+            self._types.setdefault(name, "histogram")
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [buckets, [0] * (len(buckets) + 1), 0.0]
+            histogram[1][bisect.bisect_left(buckets, value)] += 1
+            histogram[2] += value
+
+    def render(self):
+        with self._lock:
+            types = dict(self._types)
+            values = sorted(self._values.items())
+            histograms = sorted((key, (buckets, list(counts), total)) for key, (buckets, counts, total) in self._histograms.items())
+
+        lines = []
+        typed = set()
+        def header(name):
+            if name not in typed:
+                typed.add(name)
+                lines.append("# TYPE %s %s" % (name, types[name]))
+
+        for (name, labels), value in values:
+            header(name)
+            lines.append("%s%s %s" % (name, _labels(labels), _number(value)))
+
+        for (name, labels), (buckets, counts, total) in histograms:
+            header(name)
+            cumulative = 0
+            for bound, count in zip(buckets, counts):
+                cumulative += count
+                lines.append("%s_bucket%s %d" % (name, _labels(labels + (("le", _number(bound)),)), cumulative))
+            cumulative += counts[-1]
+            lines.append("%s_bucket%s %d" % (name, _labels(labels + (("le", "+Inf"),)), cumulative))
+            lines.append("%s_sum%s %s" % (name, _labels(labels), _number(total)))
+            lines.append("%s_count%s %d" % (name, _labels(labels), cumulative))
+
+        return "\n".join(lines) + "\n"
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (key, str(value).replace("\\", "\\\\").replace('"', '\\"')) for key, value in labels)
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+registry = Metrics()
+
+def _status(status):
+    return "error" if status is None else status
+
+def converted(sender, batch_size, duration, **kwargs):
+    registry.inc("postmark_converted_messages_total", batch_size)
+    registry.observe("postmark_convert_seconds", duration)
+
+def encoded(sender, batch_size, bytes, duration, **kwargs):
+    registry.inc("postmark_encoded_bytes_total", bytes)
+    registry.observe("postmark_encode_seconds", duration)
+    registry.observe("postmark_batch_size", batch_size, SIZE_BUCKETS)
+
+def requested(sender, batch_size, bytes, attempt, status, duration, **kwargs):
+    registry.inc("postmark_requests_total", status=_status(status))
+    registry.inc("postmark_request_bytes_total", bytes)
+    if attempt:
+        registry.inc("postmark_retries_total")
+    registry.observe("postmark_request_seconds", duration)
+
+def persisted(sender, accepted, rejected, duration, **kwargs):
+    registry.inc("postmark_messages_total", accepted, result="accepted")
+    registry.inc("postmark_messages_total", rejected, result="rejected")
+    registry.observe("postmark_persist_seconds", duration)
+
+def webhook(sender, hook, request, status, bytes, duration, **kwargs):
+    registry.inc("postmark_webhook_requests_total", hook=hook, status=status)
+    registry.inc("postmark_webhook_bytes_total", bytes, hook=hook)
+    registry.observe("postmark_webhook_seconds", duration, hook=hook)
+
+def circuit_changed(sender, name, old_state, new_state, **kwargs):
+    registry.set("postmark_circuit_state", CIRCUIT_STATES[new_state], name=name)
+    registry.inc("postmark_circuit_changes_total", name=name, state=new_state)
+
+def connect():
+    """
+    Starts recording the instrumentation signals into registry. Called when
+    postmark is loaded if POSTMARK_METRICS is set.
+    """
+    signals.post_convert.connect(converted, dispatch_uid="postmark.metrics")
+    signals.post_encode.connect(encoded, dispatch_uid="postmark.metrics")
+    signals.post_request.connect(requested, dispatch_uid="postmark.metrics")
+    signals.post_persist.connect(persisted, dispatch_uid="postmark.metrics")
+    signals.post_webhook.connect(webhook, dispatch_uid="postmark.metrics")
+    signals.circuit_state_changed.connect(circuit_changed, dispatch_uid="postmark.metrics")
+
+if POSTMARK_METRICS:
+    connect()
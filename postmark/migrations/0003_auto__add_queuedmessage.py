@@ -0,0 +1,74 @@
+# encoding: utf-8
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        
+        # Adding model 'QueuedMessage'
+        db.create_table('postmark_queuedmessage', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('claimed_by', self.gf('django.db.models.fields.CharField')(max_length=32, blank=True)),
+            ('claimed_at', self.gf('django.db.models.fields.DateTimeField')(db_index=True, null=True, blank=True)),
+            ('payload', self.gf('django.db.models.fields.TextField')()),
+            ('created_at', self.gf('django.db.models.fields.DateTimeField')(auto_now_add=True, blank=True)),
+            ('attempts', self.gf('django.db.models.fields.PositiveIntegerField')(default=0)),
+            ('failed', self.gf('django.db.models.fields.BooleanField')(default=False)),
+            ('last_error', self.gf('django.db.models.fields.TextField')(blank=True)),
+        ))
+        db.send_create_signal('postmark', ['QueuedMessage'])
+
+
+    def backwards(self, orm):
+        
+        # Deleting model 'QueuedMessage'
+        db.delete_table('postmark_queuedmessage')
+
+
+    models = {
+        'postmark.emailbounce': {
+            'Meta': {'ordering': "('_order',)", 'object_name': 'EmailBounce'},
+            '_order': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'bounced_at': ('django.db.models.fields.DateTimeField', [], {}),
+            'can_activate': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'description': ('django.db.models.fields.TextField', [], {}),
+            'details': ('django.db.models.fields.TextField', [], {}),
+            'id': ('django.db.models.fields.PositiveIntegerField', [], {'primary_key': 'True'}),
+            'inactive': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'message': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'bounces'", 'to': "orm['postmark.EmailMessage']"}),
+            'type': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        },
+        'postmark.emailmessage': {
+            'Meta': {'ordering': "['-submitted_at']", 'object_name': 'EmailMessage'},
+            'attachments': ('django.db.models.fields.TextField', [], {}),
+            'headers': ('django.db.models.fields.TextField', [], {}),
+            'html_body': ('django.db.models.fields.TextField', [], {}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'message_id': ('django.db.models.fields.CharField', [], {'max_length': '40'}),
+            'reply_to': ('django.db.models.fields.CharField', [], {'max_length': '150'}),
+            'sender': ('django.db.models.fields.CharField', [], {'max_length': '150'}),
+            'status': ('django.db.models.fields.CharField', [], {'max_length': '150'}),
+            'subject': ('django.db.models.fields.CharField', [], {'max_length': '150'}),
+            'submitted_at': ('django.db.models.fields.DateTimeField', [], {}),
+            'tag': ('django.db.models.fields.CharField', [], {'max_length': '150'}),
+            'text_body': ('django.db.models.fields.TextField', [], {}),
+            'to': ('django.db.models.fields.CharField', [], {'max_length': '150'}),
+            'to_type': ('django.db.models.fields.CharField', [], {'max_length': '3'})
+        },
+        'postmark.queuedmessage': {
+            'Meta': {'ordering': "['id']", 'object_name': 'QueuedMessage'},
+            'attempts': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'claimed_at': ('django.db.models.fields.DateTimeField', [], {'db_index': 'True', 'null': 'True', 'blank': 'True'}),
+            'claimed_by': ('django.db.models.fields.CharField', [], {'max_length': '32', 'blank': 'True'}),
+            'created_at': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'failed': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_error': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'payload': ('django.db.models.fields.TextField', [], {})
+        }
+    }
+
+    complete_apps = ['postmark']
\ No newline at end of file
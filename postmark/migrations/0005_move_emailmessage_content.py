@@ -0,0 +1,107 @@
+# encoding: utf-8
+import datetime
+from south.db import db
+from south.v2 import DataMigration
+from django.db import models
+import hashlib
+
+CHUNK_SIZE = 1000
+
+def content_hash(text_body, html_body, headers, attachments):
+    return hashlib.sha1(u"\0".join([text_body, html_body, headers, attachments]).encode("utf-8")).hexdigest()
+
+class Migration(DataMigration):
+
+    def forwards(self, orm):
+        
+        # Moving EmailMessage bodies into EmailContent, one row per distinct content
+        last_id = 0
+        while True:
+            rows = list(orm.EmailMessage.objects.filter(id__gt=last_id, content__isnull=True).order_by("id").values_list(
+                "id", "text_body", "html_body", "headers", "attachments")[:CHUNK_SIZE])
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            
+            by_hash = {}
+            for row in rows:
+                by_hash.setdefault(content_hash(*row[1:]), []).append(row)
+            
+            for key, grouped in by_hash.items():
+                content, created = orm.EmailContent.objects.get_or_create(content_hash=key, defaults={
+                    "text_body": grouped[0][1],
+                    "html_body": grouped[0][2],
+                    "headers": grouped[0][3],
+                    "attachments": grouped[0][4],
+                })
+                orm.EmailMessage.objects.filter(id__in=[row[0] for row in grouped]).update(content=content)
+
+
+    def backwards(self, orm):
+        
+        # Copying EmailContent back onto each EmailMessage
+        for content in orm.EmailContent.objects.all().iterator():
+            orm.EmailMessage.objects.filter(content=content).update(
+                text_body=content.text_body,
+                html_body=content.html_body,
+                headers=content.headers,
+                attachments=content.attachments,
+                content=None,
+            )
+
+
+    models = {
+        'postmark.emailbounce': {
+            'Meta': {'ordering': "('_order',)", 'object_name': 'EmailBounce'},
+            '_order': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'bounced_at': ('django.db.models.fields.DateTimeField', [], {}),
+            'can_activate': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'description': ('django.db.models.fields.TextField', [], {}),
+            'details': ('django.db.models.fields.TextField', [], {}),
+            'id': ('django.db.models.fields.PositiveIntegerField', [], {'primary_key': 'True'}),
+            'inactive': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'message': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'bounces'", 'to': "orm['postmark.EmailMessage']"}),
+            'type': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        },
+        'postmark.emailcontent': {
+            'Meta': {'object_name': 'EmailContent'},
+            'attachments': ('django.db.models.fields.TextField', [], {}),
+            'content_hash': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '40'}),
+            'headers': ('django.db.models.fields.TextField', [], {}),
+            'html_body': ('django.db.models.fields.TextField', [], {}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'text_body': ('django.db.models.fields.TextField', [], {})
+        },
+        'postmark.emailmessage': {
+            'Meta': {'ordering': "['-submitted_at']", 'object_name': 'EmailMessage'},
+            'attachments': ('django.db.models.fields.TextField', [], {}),
+            'content': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'messages'", 'null': 'True', 'to': "orm['postmark.EmailContent']"}),
+            'headers': ('django.db.models.fields.TextField', [], {}),
+            'html_body': ('django.db.models.fields.TextField', [], {}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'message_id': ('django.db.models.fields.CharField', [], {'max_length': '40'}),
+            'reply_to': ('django.db.models.fields.CharField', [], {'max_length': '150'}),
+            'sender': ('django.db.models.fields.CharField', [], {'max_length': '150'}),
+            'status': ('django.db.models.fields.CharField', [], {'max_length': '150'}),
+            'subject': ('django.db.models.fields.CharField', [], {'max_length': '150'}),
+            'submitted_at': ('django.db.models.fields.DateTimeField', [], {}),
+            'tag': ('django.db.models.fields.CharField', [], {'max_length': '150'}),
+            'text_body': ('django.db.models.fields.TextField', [], {}),
+            'to': ('django.db.models.fields.CharField', [], {'max_length': '150'}),
+            'to_type': ('django.db.models.fields.CharField', [], {'max_length': '3'})
+        },
+        'postmark.queuedmessage': {
+            'Meta': {'ordering': "['id']", 'object_name': 'QueuedMessage'},
+            'attempts': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'claimed_at': ('django.db.models.fields.DateTimeField', [], {'db_index': 'True', 'null': 'True', 'blank': 'True'}),
+            'claimed_by': ('django.db.models.fields.CharField', [], {'max_length': '32', 'blank': 'True'}),
+            'created_at': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'failed': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_error': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'payload': ('django.db.models.fields.TextField', [], {})
+        }
+    }
+
+    complete_apps = ['postmark']
+    symmetrical = True
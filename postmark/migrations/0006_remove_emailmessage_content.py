@@ -0,0 +1,96 @@
+# encoding: utf-8
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        
+        # Deleting field 'EmailMessage.attachments'
+        db.delete_column('postmark_emailmessage', 'attachments')
+
+        # Deleting field 'EmailMessage.headers'
+        db.delete_column('postmark_emailmessage', 'headers')
+
+        # Deleting field 'EmailMessage.text_body'
+        db.delete_column('postmark_emailmessage', 'text_body')
+
+        # Deleting field 'EmailMessage.html_body'
+        db.delete_column('postmark_emailmessage', 'html_body')
+
+
+    def backwards(self, orm):
+        
+        # Adding field 'EmailMessage.attachments'
+        db.add_column('postmark_emailmessage', 'attachments',
+                      self.gf('django.db.models.fields.TextField')(default=''),
+                      keep_default=False)
+
+        # Adding field 'EmailMessage.headers'
+        db.add_column('postmark_emailmessage', 'headers',
+                      self.gf('django.db.models.fields.TextField')(default=''),
+                      keep_default=False)
+
+        # Adding field 'EmailMessage.text_body'
+        db.add_column('postmark_emailmessage', 'text_body',
+                      self.gf('django.db.models.fields.TextField')(default=''),
+                      keep_default=False)
+
+        # Adding field 'EmailMessage.html_body'
+        db.add_column('postmark_emailmessage', 'html_body',
+                      self.gf('django.db.models.fields.TextField')(default=''),
+                      keep_default=False)
+
+
+    models = {
+        'postmark.emailbounce': {
+            'Meta': {'ordering': "('_order',)", 'object_name': 'EmailBounce'},
+            '_order': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'bounced_at': ('django.db.models.fields.DateTimeField', [], {}),
+            'can_activate': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'description': ('django.db.models.fields.TextField', [], {}),
+            'details': ('django.db.models.fields.TextField', [], {}),
+            'id': ('django.db.models.fields.PositiveIntegerField', [], {'primary_key': 'True'}),
+            'inactive': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'message': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'bounces'", 'to': "orm['postmark.EmailMessage']"}),
+            'type': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        },
+        'postmark.emailcontent': {
+            'Meta': {'object_name': 'EmailContent'},
+            'attachments': ('django.db.models.fields.TextField', [], {}),
+            'content_hash': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '40'}),
+            'headers': ('django.db.models.fields.TextField', [], {}),
+            'html_body': ('django.db.models.fields.TextField', [], {}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'text_body': ('django.db.models.fields.TextField', [], {})
+        },
+        'postmark.emailmessage': {
+            'Meta': {'ordering': "['-submitted_at']", 'object_name': 'EmailMessage'},
+            'content': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'messages'", 'null': 'True', 'to': "orm['postmark.EmailContent']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'message_id': ('django.db.models.fields.CharField', [], {'max_length': '40'}),
+            'reply_to': ('django.db.models.fields.CharField', [], {'max_length': '150'}),
+            'sender': ('django.db.models.fields.CharField', [], {'max_length': '150'}),
+            'status': ('django.db.models.fields.CharField', [], {'max_length': '150'}),
+            'subject': ('django.db.models.fields.CharField', [], {'max_length': '150'}),
+            'submitted_at': ('django.db.models.fields.DateTimeField', [], {}),
+            'tag': ('django.db.models.fields.CharField', [], {'max_length': '150'}),
+            'to': ('django.db.models.fields.CharField', [], {'max_length': '150'}),
+            'to_type': ('django.db.models.fields.CharField', [], {'max_length': '3'})
+        },
+        'postmark.queuedmessage': {
+            'Meta': {'ordering': "['id']", 'object_name': 'QueuedMessage'},
+            'attempts': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'claimed_at': ('django.db.models.fields.DateTimeField', [], {'db_index': 'True', 'null': 'True', 'blank': 'True'}),
+            'claimed_by': ('django.db.models.fields.CharField', [], {'max_length': '32', 'blank': 'True'}),
+            'created_at': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'failed': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_error': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'payload': ('django.db.models.fields.TextField', [], {})
+        }
+    }
+
+    complete_apps = ['postmark']
\ No newline at end of file
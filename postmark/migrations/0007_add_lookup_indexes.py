@@ -0,0 +1,106 @@
+# encoding: utf-8
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        
+        # Adding index on 'EmailMessage', fields ['message_id', 'to']
+        db.create_index('postmark_emailmessage', ['message_id', 'to'])
+
+        # Adding index on 'EmailMessage', fields ['status']
+        db.create_index('postmark_emailmessage', ['status'])
+
+        # Adding index on 'EmailMessage', fields ['submitted_at']
+        db.create_index('postmark_emailmessage', ['submitted_at'])
+
+        # Adding index on 'EmailMessage', fields ['to_type']
+        db.create_index('postmark_emailmessage', ['to_type'])
+
+        # Adding index on 'EmailMessage', fields ['tag']
+        db.create_index('postmark_emailmessage', ['tag'])
+
+        # Adding index on 'EmailBounce', fields ['type']
+        db.create_index('postmark_emailbounce', ['type'])
+
+        # Adding index on 'EmailBounce', fields ['bounced_at']
+        db.create_index('postmark_emailbounce', ['bounced_at'])
+
+
+    def backwards(self, orm):
+        
+        # Removing index on 'EmailBounce', fields ['bounced_at']
+        db.delete_index('postmark_emailbounce', ['bounced_at'])
+
+        # Removing index on 'EmailBounce', fields ['type']
+        db.delete_index('postmark_emailbounce', ['type'])
+
+        # Removing index on 'EmailMessage', fields ['tag']
+        db.delete_index('postmark_emailmessage', ['tag'])
+
+        # Removing index on 'EmailMessage', fields ['to_type']
+        db.delete_index('postmark_emailmessage', ['to_type'])
+
+        # Removing index on 'EmailMessage', fields ['submitted_at']
+        db.delete_index('postmark_emailmessage', ['submitted_at'])
+
+        # Removing index on 'EmailMessage', fields ['status']
+        db.delete_index('postmark_emailmessage', ['status'])
+
+        # Removing index on 'EmailMessage', fields ['message_id', 'to']
+        db.delete_index('postmark_emailmessage', ['message_id', 'to'])
+
+
+    models = {
+        'postmark.emailbounce': {
+            'Meta': {'ordering': "('_order',)", 'object_name': 'EmailBounce'},
+            '_order': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'bounced_at': ('django.db.models.fields.DateTimeField', [], {'db_index': 'True'}),
+            'can_activate': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'description': ('django.db.models.fields.TextField', [], {}),
+            'details': ('django.db.models.fields.TextField', [], {}),
+            'id': ('django.db.models.fields.PositiveIntegerField', [], {'primary_key': 'True'}),
+            'inactive': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'message': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'bounces'", 'to': "orm['postmark.EmailMessage']"}),
+            'type': ('django.db.models.fields.CharField', [], {'max_length': '100', 'db_index': 'True'})
+        },
+        'postmark.emailcontent': {
+            'Meta': {'object_name': 'EmailContent'},
+            'attachments': ('django.db.models.fields.TextField', [], {}),
+            'content_hash': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '40'}),
+            'headers': ('django.db.models.fields.TextField', [], {}),
+            'html_body': ('django.db.models.fields.TextField', [], {}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'text_body': ('django.db.models.fields.TextField', [], {})
+        },
+        'postmark.emailmessage': {
+            'Meta': {'ordering': "['-submitted_at']", 'object_name': 'EmailMessage'},
+            'content': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'messages'", 'null': 'True', 'to': "orm['postmark.EmailContent']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'message_id': ('django.db.models.fields.CharField', [], {'max_length': '40'}),
+            'reply_to': ('django.db.models.fields.CharField', [], {'max_length': '150'}),
+            'sender': ('django.db.models.fields.CharField', [], {'max_length': '150'}),
+            'status': ('django.db.models.fields.CharField', [], {'max_length': '150', 'db_index': 'True'}),
+            'subject': ('django.db.models.fields.CharField', [], {'max_length': '150'}),
+            'submitted_at': ('django.db.models.fields.DateTimeField', [], {'db_index': 'True'}),
+            'tag': ('django.db.models.fields.CharField', [], {'max_length': '150', 'db_index': 'True'}),
+            'to': ('django.db.models.fields.CharField', [], {'max_length': '150'}),
+            'to_type': ('django.db.models.fields.CharField', [], {'max_length': '3', 'db_index': 'True'})
+        },
+        'postmark.queuedmessage': {
+            'Meta': {'ordering': "['id']", 'object_name': 'QueuedMessage'},
+            'attempts': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'claimed_at': ('django.db.models.fields.DateTimeField', [], {'db_index': 'True', 'null': 'True', 'blank': 'True'}),
+            'claimed_by': ('django.db.models.fields.CharField', [], {'max_length': '32', 'blank': 'True'}),
+            'created_at': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'failed': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_error': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'payload': ('django.db.models.fields.TextField', [], {})
+        }
+    }
+
+    complete_apps = ['postmark']
\ No newline at end of file
@@ -0,0 +1,165 @@
+# encoding: utf-8
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        
+        # Adding model 'InboundAttachment'
+        db.create_table('postmark_inboundattachment', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('message', self.gf('django.db.models.fields.related.ForeignKey')(related_name='attachments', to=orm['postmark.InboundMessage'])),
+            ('name', self.gf('django.db.models.fields.CharField')(max_length=255, blank=True)),
+            ('content_type', self.gf('django.db.models.fields.CharField')(max_length=100, blank=True)),
+            ('content_id', self.gf('django.db.models.fields.CharField')(max_length=255, blank=True)),
+            ('size', self.gf('django.db.models.fields.PositiveIntegerField')()),
+            ('file', self.gf('django.db.models.fields.files.FileField')(max_length=255)),
+        ))
+        db.send_create_signal('postmark', ['InboundAttachment'])
+
+        # Adding model 'InboundMessage'
+        db.create_table('postmark_inboundmessage', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('message_id', self.gf('django.db.models.fields.CharField')(unique=True, max_length=40)),
+            ('received_at', self.gf('django.db.models.fields.DateTimeField')(auto_now_add=True, db_index=True, blank=True)),
+            ('date', self.gf('django.db.models.fields.CharField')(max_length=100, blank=True)),
+            ('from_email', self.gf('django.db.models.fields.CharField')(max_length=255)),
+            ('to', self.gf('django.db.models.fields.TextField')()),
+            ('cc', self.gf('django.db.models.fields.TextField')(blank=True)),
+            ('reply_to', self.gf('django.db.models.fields.CharField')(max_length=255, blank=True)),
+            ('subject', self.gf('django.db.models.fields.TextField')(blank=True)),
+            ('tag', self.gf('django.db.models.fields.CharField')(max_length=150, blank=True)),
+            ('mailbox_hash', self.gf('django.db.models.fields.CharField')(db_index=True, max_length=150, blank=True)),
+            ('text_body', self.gf('django.db.models.fields.TextField')(blank=True)),
+            ('html_body', self.gf('django.db.models.fields.TextField')(blank=True)),
+            ('stripped_text_reply', self.gf('django.db.models.fields.TextField')(blank=True)),
+            ('headers', self.gf('django.db.models.fields.TextField')(blank=True)),
+        ))
+        db.send_create_signal('postmark', ['InboundMessage'])
+
+
+    def backwards(self, orm):
+        
+        # Deleting model 'InboundAttachment'
+        db.delete_table('postmark_inboundattachment')
+
+        # Deleting model 'InboundMessage'
+        db.delete_table('postmark_inboundmessage')
+
+
+    models = {
+        'postmark.bounceinbox': {
+            'Meta': {'ordering': "['id']", 'object_name': 'BounceInbox'},
+            'claimed_at': ('django.db.models.fields.DateTimeField', [], {'db_index': 'True', 'null': 'True', 'blank': 'True'}),
+            'claimed_by': ('django.db.models.fields.CharField', [], {'max_length': '32', 'blank': 'True'}),
+            'failed': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_error': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'payload': ('django.db.models.fields.TextField', [], {}),
+            'received_at': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'})
+        },
+        'postmark.deliverystat': {
+            'Meta': {'ordering': "['-day', 'tag', 'status', 'bounce_type']", 'unique_together': "(('day', 'tag', 'status', 'bounce_type'),)", 'object_name': 'DeliveryStat'},
+            'bounce_type': ('django.db.models.fields.CharField', [], {'max_length': '100', 'blank': 'True'}),
+            'bounced': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'day': ('django.db.models.fields.DateField', [], {}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'sent': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'status': ('django.db.models.fields.CharField', [], {'max_length': '150', 'blank': 'True'}),
+            'tag': ('django.db.models.fields.CharField', [], {'max_length': '150', 'blank': 'True'})
+        },
+        'postmark.emailbounce': {
+            'Meta': {'ordering': "('_order',)", 'object_name': 'EmailBounce'},
+            '_order': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'bounced_at': ('django.db.models.fields.DateTimeField', [], {'db_index': 'True'}),
+            'can_activate': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'description': ('django.db.models.fields.TextField', [], {}),
+            'details': ('django.db.models.fields.TextField', [], {}),
+            'id': ('django.db.models.fields.PositiveIntegerField', [], {'primary_key': 'True'}),
+            'inactive': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'message': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'bounces'", 'to': "orm['postmark.EmailMessage']"}),
+            'type': ('django.db.models.fields.CharField', [], {'max_length': '100', 'db_index': 'True'})
+        },
+        'postmark.emailcontent': {
+            'Meta': {'object_name': 'EmailContent'},
+            'attachments': ('django.db.models.fields.TextField', [], {}),
+            'compressed': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'content_hash': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '40'}),
+            'headers': ('django.db.models.fields.TextField', [], {}),
+            'html_body': ('django.db.models.fields.TextField', [], {}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'text_body': ('django.db.models.fields.TextField', [], {})
+        },
+        'postmark.emailmessage': {
+            'Meta': {'ordering': "['-submitted_at']", 'object_name': 'EmailMessage'},
+            'content': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'messages'", 'null': 'True', 'to': "orm['postmark.EmailContent']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'message_id': ('django.db.models.fields.CharField', [], {'max_length': '40'}),
+            'reply_to': ('django.db.models.fields.CharField', [], {'max_length': '150'}),
+            'sender': ('django.db.models.fields.CharField', [], {'max_length': '150'}),
+            'status': ('django.db.models.fields.CharField', [], {'max_length': '150', 'db_index': 'True'}),
+            'subject': ('django.db.models.fields.CharField', [], {'max_length': '150'}),
+            'submitted_at': ('django.db.models.fields.DateTimeField', [], {'db_index': 'True'}),
+            'tag': ('django.db.models.fields.CharField', [], {'max_length': '150', 'db_index': 'True'}),
+            'to': ('django.db.models.fields.CharField', [], {'max_length': '150', 'db_index': 'True'}),
+            'to_type': ('django.db.models.fields.CharField', [], {'max_length': '3', 'db_index': 'True'})
+        },
+        'postmark.inboundattachment': {
+            'Meta': {'object_name': 'InboundAttachment'},
+            'content_id': ('django.db.models.fields.CharField', [], {'max_length': '255', 'blank': 'True'}),
+            'content_type': ('django.db.models.fields.CharField', [], {'max_length': '100', 'blank': 'True'}),
+            'file': ('django.db.models.fields.files.FileField', [], {'max_length': '255'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'message': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'attachments'", 'to': "orm['postmark.InboundMessage']"}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '255', 'blank': 'True'}),
+            'size': ('django.db.models.fields.PositiveIntegerField', [], {})
+        },
+        'postmark.inboundmessage': {
+            'Meta': {'ordering': "['-received_at']", 'object_name': 'InboundMessage'},
+            'cc': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'date': ('django.db.models.fields.CharField', [], {'max_length': '100', 'blank': 'True'}),
+            'from_email': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'headers': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'html_body': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'mailbox_hash': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '150', 'blank': 'True'}),
+            'message_id': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '40'}),
+            'received_at': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'reply_to': ('django.db.models.fields.CharField', [], {'max_length': '255', 'blank': 'True'}),
+            'stripped_text_reply': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'subject': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'tag': ('django.db.models.fields.CharField', [], {'max_length': '150', 'blank': 'True'}),
+            'text_body': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'to': ('django.db.models.fields.TextField', [], {})
+        },
+        'postmark.queuedmessage': {
+            'Meta': {'ordering': "['id']", 'object_name': 'QueuedMessage'},
+            'attempts': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'claimed_at': ('django.db.models.fields.DateTimeField', [], {'db_index': 'True', 'null': 'True', 'blank': 'True'}),
+            'claimed_by': ('django.db.models.fields.CharField', [], {'max_length': '32', 'blank': 'True'}),
+            'created_at': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'failed': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_error': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'payload': ('django.db.models.fields.TextField', [], {})
+        },
+        'postmark.suppression': {
+            'Meta': {'ordering': "['email']", 'object_name': 'Suppression'},
+            'created_at': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'email': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '150'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'reason': ('django.db.models.fields.CharField', [], {'max_length': '100', 'blank': 'True'})
+        },
+        'postmark.synccursor': {
+            'Meta': {'object_name': 'SyncCursor'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '50'}),
+            'updated_at': ('django.db.models.fields.DateTimeField', [], {'auto_now': 'True', 'blank': 'True'}),
+            'value': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        }
+    }
+
+    complete_apps = ['postmark']
\ No newline at end of file
@@ -1,14 +1,41 @@
+from __future__ import with_statement
+
 from django.utils.translation import ugettext_lazy as _
+from django.utils.timezone import now as tz_now
 from django.dispatch import receiver
-from django.db import models
+from django.db import models, connection, transaction, IntegrityError
+from django.db.models import F, Sum
+from django.core.files.storage import get_storage_class
+from django.core.files import File
+from django.conf import settings
 from itertools import izip_longest
-from datetime import datetime
-from pytz import timezone
+from datetime import timedelta
 import pytz
+import hashlib
+import base64
+import uuid
+import zlib
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from postmark.encoding import stored_attachments
+from postmark.signals import post_send_batch
+from postmark import suppression
+# Records the instrumentation signals when POSTMARK_METRICS is set
+from postmark import metrics
+from postmark.timestamps import parse_timestamp
+from postmark.inbound import parse_inbound
 
-from postmark.signals import post_send
+# Settings
+POSTMARK_DELIVERY_STATS = getattr(settings, "POSTMARK_DELIVERY_STATS", True)
+POSTMARK_INBOUND_STORAGE = getattr(settings, "POSTMARK_INBOUND_STORAGE", None)
+POSTMARK_INBOUND_UPLOAD_TO = getattr(settings, "POSTMARK_INBOUND_UPLOAD_TO", "postmark/inbound/%Y/%m/%d")
 
-POSTMARK_DATETIME_STRING = "%Y-%m-%dT%H:%M:%S.%f"
+# Number of values passed to a single IN (...) lookup
+QUERY_CHUNK_SIZE = 500
 
 TO_CHOICES = (
     ("to", _("Recipient")),
@@ -16,6 +43,12 @@ TO_CHOICES = (
     ("bcc", _("Blind Carbon Copy")),
 )
 
+EVENT_TYPES = (
+    ("Delivery", _("Delivery")),
+    ("Open", _("Open")),
+    ("Click", _("Click")),
+)
+
 BOUNCE_TYPES = (
     ("HardBounce", _("Hard Bounce")),
     ("Transient", _("Transient")),
@@ -37,27 +70,129 @@ BOUNCE_TYPES = (
     ("Blocked", _("Blocked")),
 )
 
+class EmailContentManager(models.Manager):
+    
+    def for_hashes(self, contents):
+        """
+        Takes a dict mapping content hashes to EmailContent field values and
+        returns a dict mapping each hash to the id of its EmailContent. Only
+        the contents not stored yet are inserted, with a single bulk insert.
+        
+        The rows are locked until the end of the transaction, so
+        postmark_purge can't delete content that no message points at yet.
+        Call it in the same transaction that stores the messages, as
+        sent_messages does.
+        """
+        found = dict(self.select_for_update().filter(content_hash__in=contents.keys())
+            .order_by("id").values_list("content_hash", "id"))
+        missing = [h for h in contents if h not in found]
+        
+        if missing:
+            sid = transaction.savepoint()
+            try:
+                self.bulk_create([EmailContent(content_hash=h, **contents[h]) for h in missing])
+            except IntegrityError:
+                # Another process stored some of the same content in the meantime
+                transaction.savepoint_rollback(sid)
+                for h in missing:
+                    self.get_or_create(content_hash=h, defaults=contents[h])
+            else:
+                transaction.savepoint_commit(sid)
+            
+            found.update(self.select_for_update().filter(content_hash__in=missing)
+                .order_by("id").values_list("content_hash", "id"))
+        
+        return found
+
+class EmailContent(models.Model):
+    """
+    The bodies, headers and attachments of a sent message. Identical content
+    is stored once however often it is sent, EmailMessage rows point at it.
+    
+    Old content may be compressed in place by the postmark_purge command, use
+    get_field() to read it either way.
+    """
+    
+    COMPRESSED_FIELDS = ("text_body", "html_body", "headers", "attachments")
+    
+    content_hash = models.CharField(_("Content Hash"), max_length=40, unique=True)
+    text_body = models.TextField(_("Text Body"))
+    html_body = models.TextField(_("HTML Body"))
+    
+    headers = models.TextField(_("Headers"))
+    attachments = models.TextField(_("Attachments"))
+    
+    compressed = models.BooleanField(_("Compressed"), default=False)
+    
+    objects = EmailContentManager()
+    
+    def __unicode__(self):
+        return u"%s" % (self.content_hash,)
+    
+    def get_field(self, name):
+        """
+        Returns the value of one of COMPRESSED_FIELDS, decompressed if needed.
+        """
+        value = getattr(self, name)
+        if self.compressed and value:
+            return zlib.decompress(base64.b64decode(value)).decode("utf-8")
+        return value
+    
+    def compress(self):
+        """
+        Replaces COMPRESSED_FIELDS with their zlib compressed, base64 encoded
+        values. The instance still has to be saved.
+        """
+        if self.compressed:
+            return
+        for name in self.COMPRESSED_FIELDS:
+            value = getattr(self, name)
+            if value:
+                setattr(self, name, base64.b64encode(zlib.compress(value.encode("utf-8"), 9)))
+        self.compressed = True
+    
+    @staticmethod
+    def make_hash(text_body, html_body, headers, attachments):
+        return hashlib.sha1(u"\0".join([text_body, html_body, headers, attachments]).encode("utf-8")).hexdigest()
+    
+    class Meta:
+        verbose_name = _("email content")
+        verbose_name_plural = _("email contents")
+
 class EmailMessage(models.Model):
+    # message_id and to share a composite index (see migration 0007) that
+    # serves the bounce hook's lookup as well as lookups by message_id alone.
     message_id = models.CharField(_("Message ID"), max_length=40)
-    submitted_at = models.DateTimeField(_("Submitted At"))
-    status = models.CharField(_("Status"), max_length=150)
+    submitted_at = models.DateTimeField(_("Submitted At"), db_index=True)
+    status = models.CharField(_("Status"), max_length=150, db_index=True)
     
-    to = models.CharField(_("To"), max_length=150)
-    to_type = models.CharField(_("Type"), max_length=3, choices=TO_CHOICES)
+    to = models.CharField(_("To"), max_length=150, db_index=True)
+    to_type = models.CharField(_("Type"), max_length=3, choices=TO_CHOICES, db_index=True)
     
     sender = models.CharField(_("Sender"), max_length=150)
     reply_to = models.CharField(_("Reply To"), max_length=150)
     subject = models.CharField(_("Subject"), max_length=150)
-    tag = models.CharField(_("Tag"), max_length=150)
-    text_body = models.TextField(_("Text Body"))
-    html_body = models.TextField(_("HTML Body"))
+    tag = models.CharField(_("Tag"), max_length=150, db_index=True)
     
-    headers = models.TextField(_("Headers"))
-    attachments = models.TextField(_("Attachments"))
+    content = models.ForeignKey(EmailContent, related_name="messages", verbose_name=_("Content"), null=True)
     
     def __unicode__(self):
         return u"%s" % (self.message_id,)
     
+    def _content_field(name):
+        def getter(self):
+            if self.content_id is None:
+                return u""
+            return self.content.get_field(name)
+        return property(getter)
+    
+    text_body = _content_field("text_body")
+    html_body = _content_field("html_body")
+    headers = _content_field("headers")
+    attachments = _content_field("attachments")
+    
+    del _content_field
+    
     class Meta:
         verbose_name = _("email message")
         verbose_name_plural = _("email messages")
@@ -65,6 +200,127 @@ class EmailMessage(models.Model):
         get_latest_by = "submitted_at"
         ordering = ["-submitted_at"]
 
+def bounce_payloads(payload):
+    """
+    Returns the bounces of a decoded bounce hook payload, a single bounce or a
+    list of them, as a list. Raises ValueError if the payload has any other
+    shape or a bounce lacks a field EmailBounceManager.ingest() needs.
+    """
+    bounces = payload if isinstance(payload, list) else [payload]
+    for bounce in bounces:
+        if not isinstance(bounce, dict):
+            raise ValueError("A bounce must be a JSON object, not %r." % (bounce,))
+
+        for key, types in (("ID", (int, long)), ("MessageID", (basestring, type(None))), ("Email", basestring),
+                ("Type", basestring), ("Description", basestring), ("Details", basestring),
+                ("Inactive", bool), ("CanActivate", bool), ("BouncedAt", basestring)):
+            if not isinstance(bounce.get(key), types):
+                raise ValueError("Bounce %r has a missing or invalid %s." % (bounce.get("ID"), key))
+        if isinstance(bounce["ID"], bool) or bounce["ID"] < 0:
+            raise ValueError("Bounce %r has an invalid ID." % (bounce["ID"],))
+
+        try:
+            parse_timestamp(bounce["BouncedAt"])
+        except (ValueError, IndexError):
+            raise ValueError("Bounce %r has an invalid BouncedAt." % (bounce["ID"],))
+    return bounces
+
+class EmailBounceManager(models.Manager):
+
+    def ingest(self, bounces, unmatched=None):
+        """
+        Stores a list of bounce payloads, as posted to the bounce hook, and
+        returns the EmailBounce objects that were created. Parent messages are
+        resolved and existing bounces found with a query per few hundred
+        bounces, and the new bounces are written with a single bulk insert.
+        
+        Like the hook has always been, ingesting is idempotent on the bounce
+        ID: bounces that are already stored are left untouched. Bounces whose
+        message is not known are skipped, and appended to unmatched if it is
+        a list.
+        """
+        pending = {}
+        for bounce in bounces:
+            pending.setdefault(bounce["ID"], bounce)
+        
+        for ids in _chunked(pending.keys(), QUERY_CHUNK_SIZE):
+            for pk in self.filter(id__in=ids).values_list("id", flat=True):
+                del pending[pk]
+        
+        messages = {}
+        for message_ids in _chunked(set(bounce["MessageID"] for bounce in pending.values()), QUERY_CHUNK_SIZE):
+            for row in EmailMessage.objects.filter(message_id__in=message_ids).values_list(
+                    "id", "message_id", "to", "submitted_at", "tag", "status"):
+                messages[(row[1], row[2])] = row
+        
+        timestamps = {}
+        created = []
+        for bounce in pending.values():
+            message = messages.get((bounce["MessageID"], bounce["Email"]))
+            if message is None:
+                if unmatched is not None:
+                    unmatched.append(bounce)
+                continue
+            
+            if bounce["BouncedAt"] not in timestamps:
+                timestamps[bounce["BouncedAt"]] = parse_timestamp(bounce["BouncedAt"])
+            
+            created.append(EmailBounce(
+                id=bounce["ID"],
+                message_id=message[0],
+                type=bounce["Type"],
+                description=bounce["Description"],
+                details=bounce["Details"],
+                inactive=bounce["Inactive"],
+                can_activate=bounce["CanActivate"],
+                bounced_at=timestamps[bounce["BouncedAt"]],
+                # bulk_create does not fill in order_with_respect_to's column
+                _order=0,
+            ))
+        
+        if not created:
+            return created
+        
+        sid = transaction.savepoint()
+        try:
+            self.bulk_create(created)
+        except IntegrityError:
+            # A concurrent delivery of the same bounces got there first
+            transaction.savepoint_rollback(sid)
+            stored = []
+            for bounce in created:
+                bounce, was_created = self.get_or_create(id=bounce.id, defaults={
+                    "message_id": bounce.message_id,
+                    "type": bounce.type,
+                    "description": bounce.description,
+                    "details": bounce.details,
+                    "inactive": bounce.inactive,
+                    "can_activate": bounce.can_activate,
+                    "bounced_at": bounce.bounced_at,
+                })
+                if was_created:
+                    stored.append(bounce)
+            created = stored
+        else:
+            transaction.savepoint_commit(sid)
+        
+        suppress = {}
+        for bounce in created:
+            if bounce.inactive and bounce.type in suppression.POSTMARK_SUPPRESSION_BOUNCE_TYPES:
+                suppress.setdefault(bounce.type, []).append(pending[bounce.id]["Email"])
+        for reason, addresses in suppress.items():
+            Suppression.objects.add(addresses, reason)
+        
+        if POSTMARK_DELIVERY_STATS:
+            counts = {}
+            for bounce in created:
+                pk, message_id, to, submitted_at, tag, status = messages[(pending[bounce.id]["MessageID"], pending[bounce.id]["Email"])]
+                key = (utc_day(submitted_at), tag, status, bounce.type)
+                counts[key] = counts.get(key, 0) + 1
+            DeliveryStat.objects.add(bounced=counts)
+        
+        return created
+
 class EmailBounce(models.Model):
     id = models.PositiveIntegerField(primary_key=True)
     message = models.ForeignKey(EmailMessage, related_name="bounces", verbose_name=_("Message"))
@@ -72,11 +328,13 @@ class EmailBounce(models.Model):
     inactive = models.BooleanField(_("Inactive"))
     can_activate = models.BooleanField(_("Can Activate"))
     
-    type = models.CharField(_("Type"), max_length=100, choices=BOUNCE_TYPES)
+    type = models.CharField(_("Type"), max_length=100, choices=BOUNCE_TYPES, db_index=True)
     description = models.TextField(_("Description"))
     details = models.TextField(_("Details"))
     
-    bounced_at = models.DateTimeField(_("Bounced At"))
+    bounced_at = models.DateTimeField(_("Bounced At"), db_index=True)
+    
+    objects = EmailBounceManager()
     
     def __unicode__(self):
         return u"Bounce: %s" % (self.message.to,)
@@ -89,38 +347,505 @@ class EmailBounce(models.Model):
         get_latest_by = "bounced_at"
         ordering = ["-bounced_at"]
 
-@receiver(post_send)
-def sent_message(sender, **kwargs):
-    msg = kwargs["message"]
-    resp = kwargs["response"]
-    
-    for recipient in (
-        list(izip_longest(msg["To"].split(","), [], fillvalue='to')) +
-        list(izip_longest(msg.get("Cc", "").split(","), [], fillvalue='cc')) +
-        list(izip_longest(msg.get("Bcc", "").split(","), [], fillvalue='bcc'))):
-        
-        if not recipient[0]:
-            continue
-        
-        timestamp, tz = resp["SubmittedAt"].rsplit("+", 1)
-        tz_offset = int(tz.split(":", 1)[0])
-        tz = timezone("Etc/GMT%s%d" % ("+" if tz_offset >= 0 else "-", tz_offset))
-        submitted_at = tz.localize(datetime.strptime(timestamp[:26], POSTMARK_DATETIME_STRING)).astimezone(pytz.utc)
-        
-        
-        emsg = EmailMessage(
-            message_id=resp["MessageID"],
-            submitted_at=submitted_at,
-            status=resp["Message"],
-            to=recipient[0],
-            to_type=recipient[1],
-            sender=msg["From"],
-            reply_to=msg.get("ReplyTo", ""),
-            subject=msg["Subject"],
-            tag=msg.get("Tag", ""),
-            text_body=msg["TextBody"],
-            html_body=msg.get("HtmlBody", ""),
-            headers=msg.get("Headers", ""),
-            attachments=msg.get("Attachments", "")
+class SuppressionManager(models.Manager):
+    
+    def add(self, addresses, reason=""):
+        """
+        Adds addresses to the suppression list, skipping the ones already on
+        it, and drops them from this process' suppression cache.
+        """
+        addresses = set(suppression.normalize_address(address) for address in addresses)
+        addresses.discard("")
+        
+        for chunk in _chunked(addresses, QUERY_CHUNK_SIZE):
+            addresses.difference_update(self.filter(email__in=chunk).values_list("email", flat=True))
+        
+        if addresses:
+            sid = transaction.savepoint()
+            try:
+                self.bulk_create([Suppression(email=address, reason=reason) for address in addresses])
+            except IntegrityError:
+                transaction.savepoint_rollback(sid)
+                for address in addresses:
+                    self.get_or_create(email=address, defaults={"reason": reason})
+            else:
+                transaction.savepoint_commit(sid)
+        
+        suppression.cache.invalidate(addresses)
+
+class Suppression(models.Model):
+    """
+    An address no mail is sent to when POSTMARK_SUPPRESSION is enabled.
+    Addresses are added when an inactive bounce of one of the
+    POSTMARK_SUPPRESSION_BOUNCE_TYPES arrives, and can be removed again in
+    the admin.
+    """
+    email = models.CharField(_("Email"), max_length=150, unique=True)
+    reason = models.CharField(_("Reason"), max_length=100, blank=True)
+    created_at = models.DateTimeField(_("Created At"), auto_now_add=True)
+    
+    objects = SuppressionManager()
+    
+    def __unicode__(self):
+        return u"%s" % (self.email,)
+    
+    class Meta:
+        verbose_name = _("suppressed address")
+        verbose_name_plural = _("suppressed addresses")
+        
+        ordering = ["email"]
+
+def utc_day(value):
+    """
+    Returns the date of a datetime in UTC, the day DeliveryStat counts it on.
+    """
+    if value.tzinfo is not None:
+        value = value.astimezone(pytz.utc)
+    return value.date()
+
+class DeliveryStatManager(models.Manager):
+    
+    def add(self, sent=None, bounced=None):
+        """
+        Adds to the counters of DeliveryStat rows, creating rows as needed.
+        sent and bounced map (day, tag, status, bounce_type) tuples to the
+        number to add. Each key costs an UPDATE, plus an INSERT the first time.
+        """
+        counts = {}
+        for key, value in (sent or {}).iteritems():
+            counts.setdefault(key, [0, 0])[0] += value
+        for key, value in (bounced or {}).iteritems():
+            counts.setdefault(key, [0, 0])[1] += value
+        
+        for (day, tag, status, bounce_type), (num_sent, num_bounced) in counts.iteritems():
+            lookup = {"day": day, "tag": tag, "status": status, "bounce_type": bounce_type}
+            if self._increment(lookup, num_sent, num_bounced):
+                continue
+            
+            sid = transaction.savepoint()
+            try:
+                self.create(sent=num_sent, bounced=num_bounced, **lookup)
+            except IntegrityError:
+                # Created by a concurrent writer in the meantime
+                transaction.savepoint_rollback(sid)
+                self._increment(lookup, num_sent, num_bounced)
+            else:
+                transaction.savepoint_commit(sid)
+    
+    def _increment(self, lookup, num_sent, num_bounced):
+        return self.filter(**lookup).update(sent=F("sent") + num_sent, bounced=F("bounced") + num_bounced)
+    
+    def totals(self, start=None, end=None, group_by=(), **filters):
+        """
+        Returns the sent and bounced totals for the days from start to end,
+        both inclusive, as a list of dicts with a bounce_rate as well.
+        group_by names any of "day", "tag", "status" and "bounce_type" to
+        get a dict per combination, other keyword arguments filter the rows,
+        e.g. totals(yesterday, yesterday, group_by=["tag"]).
+        
+        Sends are counted with an empty bounce_type, so grouping by
+        bounce_type puts them in a group of their own.
+        """
+        queryset = self.filter(**filters)
+        if start is not None:
+            queryset = queryset.filter(day__gte=start)
+        if end is not None:
+            queryset = queryset.filter(day__lte=end)
+        
+        if group_by:
+            rows = list(queryset.values(*group_by).annotate(sent=Sum("sent"), bounced=Sum("bounced")).order_by(*group_by))
+        else:
+            rows = [queryset.aggregate(sent=Sum("sent"), bounced=Sum("bounced"))]
+        
+        for row in rows:
+            row["sent"] = row["sent"] or 0
+            row["bounced"] = row["bounced"] or 0
+            row["bounce_rate"] = float(row["bounced"]) / row["sent"] if row["sent"] else 0.0
+        return rows
+    
+    def bounce_rate(self, start=None, end=None, **filters):
+        """
+        Returns bounced / sent over the days from start to end, both inclusive.
+        """
+        return self.totals(start, end, **filters)[0]["bounce_rate"]
+
+class DeliveryStat(models.Model):
+    """
+    Rolled up counts of sent messages and bounces, per UTC day the messages
+    were submitted on, tag, send status and bounce type. Kept up to date as
+    messages are sent and bounces are ingested, so reports never have to
+    scan EmailMessage or EmailBounce. Counts are per recipient, like
+    EmailMessage rows; sends are counted with an empty bounce_type.
+    """
+    
+    day = models.DateField(_("Day"))
+    tag = models.CharField(_("Tag"), max_length=150, blank=True)
+    status = models.CharField(_("Status"), max_length=150, blank=True)
+    bounce_type = models.CharField(_("Bounce Type"), max_length=100, choices=BOUNCE_TYPES, blank=True)
+    
+    sent = models.PositiveIntegerField(_("Sent"), default=0)
+    bounced = models.PositiveIntegerField(_("Bounced"), default=0)
+    
+    objects = DeliveryStatManager()
+    
+    def __unicode__(self):
+        return u"%s %s %s %s" % (self.day, self.tag, self.status, self.bounce_type)
+    
+    class Meta:
+        verbose_name = _("delivery statistic")
+        verbose_name_plural = _("delivery statistics")
+        
+        unique_together = (("day", "tag", "status", "bounce_type"),)
+        ordering = ["-day", "tag", "status", "bounce_type"]
+
+class EmailEvent(models.Model):
+    """
+    A delivery, open or click reported by Postmark's webhooks. Events are only
+    ever appended, in bulk by postmark.events.EventBuffer, and refer to their
+    message by its Postmark Message ID rather than a foreign key, so they are
+    written without lookups and outlive purged messages.
+    """
+    
+    # Fields of the webhook payloads kept in columns of their own, the rest
+    # are stored in details.
+    PAYLOAD_FIELDS = ("RecordType", "MessageID", "Recipient", "Tag", "DeliveredAt", "ReceivedAt")
+    
+    type = models.CharField(_("Type"), max_length=20, choices=EVENT_TYPES)
+    message_id = models.CharField(_("Message ID"), max_length=40, db_index=True)
+    recipient = models.CharField(_("Recipient"), max_length=150)
+    tag = models.CharField(_("Tag"), max_length=150, blank=True)
+    occurred_at = models.DateTimeField(_("Occurred At"), db_index=True)
+    details = models.TextField(_("Details"), blank=True)
+    
+    def __unicode__(self):
+        return u"%s %s" % (self.type, self.message_id)
+    
+    @classmethod
+    def from_payload(cls, type, payload):
+        """
+        Returns an unsaved EmailEvent for a webhook payload. Raises KeyError
+        if the payload has no MessageID.
+        """
+        timestamp = payload.get("DeliveredAt") or payload.get("ReceivedAt")
+        details = dict((key, value) for key, value in payload.iteritems() if key not in cls.PAYLOAD_FIELDS)
+        return cls(
+            type=type,
+            message_id=payload["MessageID"],
+            recipient=payload.get("Recipient") or "",
+            tag=payload.get("Tag") or "",
+            occurred_at=parse_timestamp(timestamp) if timestamp else tz_now(),
+            details=json.dumps(details) if details else "",
         )
-        emsg.save()
\ No newline at end of file
+    
+    def get_message(self):
+        """
+        Returns the EmailMessage the event is about, or None if it is not
+        stored (anymore).
+        """
+        try:
+            return EmailMessage.objects.filter(message_id=self.message_id, to=self.recipient)[0]
+        except IndexError:
+            return None
+    
+    class Meta:
+        verbose_name = _("email event")
+        verbose_name_plural = _("email events")
+        
+        get_latest_by = "occurred_at"
+        ordering = ["-occurred_at"]
+
+class InboundMessageManager(models.Manager):
+    
+    def ingest(self, fp):
+        """
+        Reads an inbound hook payload from the file-like object fp, e.g. the
+        request, and stores it. Returns the InboundMessage and the list of its
+        InboundAttachments, or None and an empty list if a message with the
+        same MessageID was stored before.
+        
+        The payload is parsed as it is read and attachments are decoded
+        straight to a temporary file and from there to storage, so memory use
+        does not grow with their size.
+        """
+        stored = []
+        def save_attachment(fields, content, size):
+            attachment = InboundAttachment(
+                name=fields.get("Name") or "",
+                content_type=fields.get("ContentType") or "",
+                content_id=fields.get("ContentID") or "",
+                size=size,
+            )
+            content = File(content)
+            content.size = size
+            attachment.file.save(attachment.name or "attachment", content, save=False)
+            stored.append(attachment)
+            return attachment
+        
+        try:
+            payload = parse_inbound(fp, save_attachment)
+            
+            sid = transaction.savepoint()
+            try:
+                message = self.create(
+                    # Only real ids are unique, NULLs never collide
+                    message_id=payload.get("MessageID") or None,
+                    from_email=payload.get("From") or "",
+                    to=payload.get("To") or "",
+                    cc=payload.get("Cc") or "",
+                    reply_to=payload.get("ReplyTo") or "",
+                    subject=payload.get("Subject") or "",
+                    tag=payload.get("Tag") or "",
+                    mailbox_hash=payload.get("MailboxHash") or "",
+                    date=payload.get("Date") or "",
+                    text_body=payload.get("TextBody") or "",
+                    html_body=payload.get("HtmlBody") or "",
+                    stripped_text_reply=payload.get("StrippedTextReply") or "",
+                    headers=json.dumps(payload.get("Headers") or []),
+                )
+            except IntegrityError:
+                # Postmark delivered the same message again
+                transaction.savepoint_rollback(sid)
+                message, attachments = None, []
+            else:
+                transaction.savepoint_commit(sid)
+                attachments = payload.get("Attachments") or []
+                for attachment in attachments:
+                    attachment.message = message
+                InboundAttachment.objects.bulk_create(attachments)
+        except:
+            for attachment in stored:
+                attachment.file.delete(save=False)
+            raise
+        
+        if message is None:
+            for attachment in stored:
+                attachment.file.delete(save=False)
+        return message, attachments
+
+class InboundMessage(models.Model):
+    """
+    A message received through Postmark's inbound hook. Its attachments are
+    InboundAttachment rows with the content in POSTMARK_INBOUND_STORAGE.
+    """
+    
+    message_id = models.CharField(_("Message ID"), max_length=40, unique=True, null=True, blank=True)
+    received_at = models.DateTimeField(_("Received At"), auto_now_add=True, db_index=True)
+    date = models.CharField(_("Date"), max_length=100, blank=True)
+    
+    from_email = models.CharField(_("From"), max_length=255)
+    to = models.TextField(_("To"))
+    cc = models.TextField(_("Cc"), blank=True)
+    reply_to = models.CharField(_("Reply To"), max_length=255, blank=True)
+    subject = models.TextField(_("Subject"), blank=True)
+    tag = models.CharField(_("Tag"), max_length=150, blank=True)
+    mailbox_hash = models.CharField(_("Mailbox Hash"), max_length=150, blank=True, db_index=True)
+    
+    text_body = models.TextField(_("Text Body"), blank=True)
+    html_body = models.TextField(_("HTML Body"), blank=True)
+    stripped_text_reply = models.TextField(_("Stripped Text Reply"), blank=True)
+    headers = models.TextField(_("Headers"), blank=True)
+    
+    objects = InboundMessageManager()
+    
+    def __unicode__(self):
+        return u"%s" % (self.message_id,)
+    
+    class Meta:
+        verbose_name = _("inbound message")
+        verbose_name_plural = _("inbound messages")
+        
+        get_latest_by = "received_at"
+        ordering = ["-received_at"]
+
+class InboundAttachment(models.Model):
+    message = models.ForeignKey(InboundMessage, related_name="attachments", verbose_name=_("Message"))
+    name = models.CharField(_("Name"), max_length=255, blank=True)
+    content_type = models.CharField(_("Content Type"), max_length=100, blank=True)
+    content_id = models.CharField(_("Content ID"), max_length=255, blank=True)
+    size = models.PositiveIntegerField(_("Size"))
+    file = models.FileField(_("File"), upload_to=POSTMARK_INBOUND_UPLOAD_TO, max_length=255,
+        storage=get_storage_class(POSTMARK_INBOUND_STORAGE)() if POSTMARK_INBOUND_STORAGE else None)
+    
+    def __unicode__(self):
+        return u"%s" % (self.name,)
+    
+    class Meta:
+        verbose_name = _("inbound attachment")
+        verbose_name_plural = _("inbound attachments")
+
+class ClaimableManager(models.Manager):
+    
+    def claimable(self):
+        """
+        Returns the rows that may be handed to a worker at all, i.e. the ones
+        that have not been given up on.
+        """
+        return self.get_query_set().filter(failed=False)
+    
+    def claim(self, limit, lease=300):
+        """
+        Claims up to limit unclaimed rows (or rows whose claim is older than
+        lease seconds) for the caller and returns them. Claims are made with a
+        conditional UPDATE, so several workers can claim concurrently without
+        ever being handed the same row. On PostgreSQL 9.5+ the candidate rows
+        are locked with SKIP LOCKED so workers do not queue up behind each
+        other.
+        """
+        token = uuid.uuid4().hex
+        now = tz_now()
+        expired = now - timedelta(seconds=lease)
+        
+        unclaimed = self.claimable().filter(models.Q(claimed_at__isnull=True) | models.Q(claimed_at__lt=expired))
+        candidates = unclaimed.order_by("id").values_list("id", flat=True)[:limit]
+        
+        if connection.vendor == "postgresql" and connection.pg_version >= 90500:
+            sql, params = candidates.query.get_compiler(connection=connection).as_sql()
+            cursor = connection.cursor()
+            cursor.execute("UPDATE %s SET claimed_by = %%s, claimed_at = %%s WHERE id IN (%s FOR UPDATE SKIP LOCKED)" % (
+                connection.ops.quote_name(self.model._meta.db_table), sql), [token, now] + list(params))
+            transaction.commit_unless_managed()
+        else:
+            with transaction.commit_on_success():
+                ids = list(candidates.select_for_update())
+                unclaimed.filter(id__in=ids).update(claimed_by=token, claimed_at=now)
+        
+        return list(self.filter(claimed_by=token).order_by("id"))
+    
+    def release(self, rows):
+        """
+        Hands claimed rows back to the queue straight away instead of waiting
+        for their lease to run out.
+        """
+        self.filter(id__in=[row.pk for row in rows]).update(claimed_by="", claimed_at=None)
+
+class ClaimableModel(models.Model):
+    """
+    Base for work queue tables that are drained in batches by management
+    commands, see ClaimableManager.claim.
+    """
+    
+    claimed_by = models.CharField(_("Claimed By"), max_length=32, blank=True)
+    claimed_at = models.DateTimeField(_("Claimed At"), null=True, blank=True, db_index=True)
+    
+    failed = models.BooleanField(_("Failed"), default=False)
+    last_error = models.TextField(_("Last Error"), blank=True)
+    
+    objects = ClaimableManager()
+    
+    class Meta:
+        abstract = True
+
+class QueuedMessage(ClaimableModel):
+    payload = models.TextField(_("Payload"))
+    created_at = models.DateTimeField(_("Created At"), auto_now_add=True)
+    attempts = models.PositiveIntegerField(_("Attempts"), default=0)
+    
+    def __unicode__(self):
+        return u"Queued message %s" % (self.pk,)
+    
+    class Meta:
+        verbose_name = _("queued message")
+        verbose_name_plural = _("queued messages")
+        
+        ordering = ["id"]
+
+class BounceInbox(ClaimableModel):
+    """
+    Raw bounce hook payloads stored by the bounce view when
+    POSTMARK_BOUNCE_DEFERRED is set, waiting for postmark_process_bounces.
+    """
+    payload = models.TextField(_("Payload"))
+    received_at = models.DateTimeField(_("Received At"), auto_now_add=True)
+    
+    def __unicode__(self):
+        return u"Bounce payload %s" % (self.pk,)
+    
+    class Meta:
+        verbose_name = _("bounce inbox entry")
+        verbose_name_plural = _("bounce inbox")
+        
+        ordering = ["id"]
+
+class SyncCursor(models.Model):
+    """
+    Where an incremental sync from Postmark's API got to, so the next run can
+    carry on from there.
+    """
+    name = models.CharField(_("Name"), max_length=50, unique=True)
+    value = models.CharField(_("Value"), max_length=100)
+    updated_at = models.DateTimeField(_("Updated At"), auto_now=True)
+    
+    def __unicode__(self):
+        return u"%s: %s" % (self.name, self.value)
+    
+    class Meta:
+        verbose_name = _("sync cursor")
+        verbose_name_plural = _("sync cursors")
+
+def _chunked(values, size):
+    values = list(values)
+    for i in xrange(0, len(values), size):
+        yield values[i:i + size]
+
+@receiver(post_send_batch)
+def sent_messages(sender, **kwargs):
+    """
+    Records one EmailMessage per To/Cc/Bcc recipient of every message in a
+    sent batch, with a single bulk insert for the whole batch. Message
+    content is stored once in EmailContent and shared between recipients,
+    messages and sends. The DeliveryStat rollups are updated in the same
+    transaction.
+    """
+    submitted = {}
+    contents = {}
+    emails = []
+    
+    for msg, resp in zip(kwargs["messages"], kwargs["responses"]):
+        if resp["SubmittedAt"] not in submitted:
+            submitted[resp["SubmittedAt"]] = parse_timestamp(resp["SubmittedAt"])
+        submitted_at = submitted[resp["SubmittedAt"]]
+        
+        content = {
+            "text_body": msg["TextBody"],
+            "html_body": msg.get("HtmlBody", ""),
+            "headers": json.dumps(msg["Headers"]) if msg.get("Headers") else u"",
+            "attachments": stored_attachments(msg.get("Attachments")),
+        }
+        content_hash = EmailContent.make_hash(**content)
+        contents[content_hash] = content
+        
+        for recipient in (
+            list(izip_longest(msg["To"].split(","), [], fillvalue='to')) +
+            list(izip_longest(msg.get("Cc", "").split(","), [], fillvalue='cc')) +
+            list(izip_longest(msg.get("Bcc", "").split(","), [], fillvalue='bcc'))):
+            
+            if not recipient[0]:
+                continue
+            
+            emails.append((content_hash, EmailMessage(
+                message_id=resp["MessageID"],
+                submitted_at=submitted_at,
+                status=resp["Message"],
+                to=recipient[0],
+                to_type=recipient[1],
+                sender=msg["From"],
+                reply_to=msg.get("ReplyTo", ""),
+                subject=msg["Subject"],
+                tag=msg.get("Tag", ""),
+            )))
+    
+    # One transaction, so the EmailContent rows for_hashes locks stay locked
+    # until the messages pointing at them are stored
+    with transaction.commit_on_success():
+        content_ids = EmailContent.objects.for_hashes(contents)
+        for content_hash, email in emails:
+            email.content_id = content_ids[content_hash]
+        
+        EmailMessage.objects.bulk_create([email for content_hash, email in emails])
+        
+        if POSTMARK_DELIVERY_STATS:
+            counts = {}
+            for content_hash, email in emails:
+                key = (utc_day(email.submitted_at), email.tag, email.status, "")
+                counts[key] = counts.get(key, 0) + 1
+            DeliveryStat.objects.add(sent=counts)
@@ -0,0 +1,238 @@
+from __future__ import with_statement
+
+from django.conf import settings
+from email.utils import parsedate_tz, mktime_tz
+import threading
+import random
+import time
+import os
+
+from postmark.signals import circuit_state_changed
+
+# Settings
+POSTMARK_MAX_RETRIES = getattr(settings, "POSTMARK_MAX_RETRIES", 3)
+POSTMARK_RETRY_BACKOFF = getattr(settings, "POSTMARK_RETRY_BACKOFF", 0.5)
+POSTMARK_RETRY_MAX_DELAY = getattr(settings, "POSTMARK_RETRY_MAX_DELAY", 30)
+POSTMARK_RETRY_AMBIGUOUS = getattr(settings, "POSTMARK_RETRY_AMBIGUOUS", False)
+POSTMARK_RATE_LIMIT = getattr(settings, "POSTMARK_RATE_LIMIT", None)
+POSTMARK_RATE_BURST = getattr(settings, "POSTMARK_RATE_BURST", None)
+POSTMARK_BREAKER_FAILURES = getattr(settings, "POSTMARK_BREAKER_FAILURES", None)
+POSTMARK_BREAKER_LATENCY = getattr(settings, "POSTMARK_BREAKER_LATENCY", None)
+POSTMARK_BREAKER_RESET = getattr(settings, "POSTMARK_BREAKER_RESET", 30)
+
+# Responses worth trying again, anything else is final. Of these only a 429,
+# and a 503 with a Retry-After, say the request was not processed.
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+def parse_retry_after(value):
+    """
+    Returns the number of seconds a Retry-After header value asks to wait,
+    given either as seconds or as an HTTP date, or None if there is none.
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        parsed = parsedate_tz(value)
+        if parsed is None:
+            return None
+        return max(mktime_tz(parsed) - time.time(), 0.0)
+
+class RetryPolicy(object):
+    """
+    Decides how often and after how long a failed request is retried. Delays
+    grow exponentially from backoff seconds and are jittered over the whole
+    interval, so clients that failed together do not retry together. A
+    Retry-After from Postmark takes precedence. Delays never exceed
+    max_delay seconds.
+    
+    Sending is not idempotent, so by default only failures where Postmark
+    provably did not process the request are retried: a connection that
+    could not be made, a 429 and a 503 with a Retry-After. Timeouts, dropped
+    connections and the other RETRY_STATUSES may follow a send that went
+    through, and are only retried with retry_ambiguous set.
+    """
+
+    def __init__(self, max_retries=None, backoff=None, max_delay=None, retry_ambiguous=None):
+        self.max_retries = max_retries if max_retries is not None else POSTMARK_MAX_RETRIES
+        self.backoff = backoff if backoff is not None else POSTMARK_RETRY_BACKOFF
+        self.max_delay = max_delay if max_delay is not None else POSTMARK_RETRY_MAX_DELAY
+        self.retry_ambiguous = retry_ambiguous if retry_ambiguous is not None else POSTMARK_RETRY_AMBIGUOUS
+
+    def should_retry(self, attempt, status=None, retry_after=None, error=None, idempotent=False):
+        """
+        Whether attempt (counting from 0) may be followed by another one.
+        status is the HTTP status of its response and retry_after the seconds
+        its Retry-After asked for, or error is the TransportError raised if
+        there was no response. Ambiguous failures are retried as well when
+        idempotent is set, e.g. for GET requests.
+        """
+        if attempt >= self.max_retries:
+            return False
+        if status is None:
+            return idempotent or self.retry_ambiguous or (error is not None and not error.request_sent)
+        if status == 429 or (status == 503 and retry_after is not None):
+            return True
+        return status in RETRY_STATUSES and (idempotent or self.retry_ambiguous)
+
+    def delay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.backoff * (2 ** attempt)))
+
+class TokenBucket(object):
+    """
+    Allows rate acquisitions per second on average and up to capacity at once.
+    acquire() blocks until a token is available. It is safe to share between
+    threads.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(rate, 1))
+        self._tokens = self.capacity
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        while True:
+            with self._lock:
+                now = time.time()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of making a request while a CircuitBreaker is open.
+    """
+    pass
+
+class CircuitBreaker(object):
+    """
+    Tracks the health of Postmark's API. After failures consecutive failed
+    requests (or requests slower than latency seconds) the breaker opens and
+    allow() refuses every request, so callers fail fast instead of waiting on
+    timeouts. After reset_timeout seconds it turns half-open and allows a
+    single probe request: success closes it again, failure reopens it.
+    
+    Every change of state sends postmark.signals.circuit_state_changed.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, name="postmark", failures=None, latency=None, reset_timeout=None):
+        self.name = name
+        self.failures = failures if failures is not None else POSTMARK_BREAKER_FAILURES
+        self.latency = latency if latency is not None else POSTMARK_BREAKER_LATENCY
+        self.reset_timeout = reset_timeout if reset_timeout is not None else POSTMARK_BREAKER_RESET
+        self.state = self.CLOSED
+        self._failed = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def is_open(self):
+        """
+        Whether requests are currently being refused, without starting a probe.
+        """
+        return self.state == self.OPEN and time.time() < self._opened_at + self.reset_timeout
+
+    def allow(self):
+        """
+        Whether a request may be made now. Once the reset timeout has passed
+        the first caller is let through as the half-open probe.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.time() < self._opened_at + self.reset_timeout:
+                    return False
+                old_state = self._set_state(self.HALF_OPEN)
+            elif self._probing:
+                return False
+            else:
+                old_state = None
+            self._probing = True
+        self._changed(old_state, self.HALF_OPEN)
+        return True
+
+    def success(self, duration=None):
+        """
+        Records a request that got a usable response after duration seconds.
+        """
+        if self.latency is not None and duration is not None and duration > self.latency:
+            return self.failure()
+
+        with self._lock:
+            self._failed = 0
+            self._probing = False
+            old_state = self._set_state(self.CLOSED)
+        self._changed(old_state, self.CLOSED)
+
+    def failure(self):
+        """
+        Records a request that failed, opening the breaker when it was the
+        probe or when there have been enough failures in a row.
+        """
+        with self._lock:
+            self._failed += 1
+            self._probing = False
+            old_state = None
+            if self.state == self.HALF_OPEN or (self.failures and self._failed >= self.failures):
+                self._opened_at = time.time()
+                old_state = self._set_state(self.OPEN)
+        self._changed(old_state, self.OPEN)
+
+    def _set_state(self, state):
+        old_state, self.state = self.state, state
+        return old_state if old_state != state else None
+
+    def _changed(self, old_state, new_state):
+        if old_state is not None:
+            circuit_state_changed.send(sender=self, name=self.name, old_state=old_state, new_state=new_state)
+
+_shared = {}
+_shared_lock = threading.Lock()
+_shared_pid = None
+
+def _get_shared(kind, key, factory):
+    global _shared_pid
+
+    with _shared_lock:
+        if _shared_pid != os.getpid():
+            _shared.clear()
+            _shared_pid = os.getpid()
+        obj = _shared.get((kind, key))
+        if obj is None:
+            obj = _shared[(kind, key)] = factory()
+        return obj
+
+def get_rate_limiter(key, rate=None, burst=None):
+    """
+    Returns the TokenBucket that every backend in this process sending with the
+    server token key shares. Returns None if no rate is given and
+    POSTMARK_RATE_LIMIT is not set.
+    """
+    rate = rate or POSTMARK_RATE_LIMIT
+    if not rate:
+        return None
+    return _get_shared("limiter", key, lambda: TokenBucket(rate, burst or POSTMARK_RATE_BURST))
+
+def get_circuit_breaker(key, name="postmark", **kwargs):
+    """
+    Returns the CircuitBreaker that every backend in this process sending with
+    the server token key shares. Returns None unless failures is given or
+    POSTMARK_BREAKER_FAILURES is set.
+    """
+    if not (kwargs.get("failures") or POSTMARK_BREAKER_FAILURES):
+        return None
+    return _get_shared("breaker", key, lambda: CircuitBreaker(name, **kwargs))
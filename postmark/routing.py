@@ -0,0 +1,73 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.conf import settings
+from email.utils import parseaddr
+
+# Settings
+POSTMARK_ROUTES = getattr(settings, "POSTMARK_ROUTES", ())
+
+class Route(object):
+    """
+    Sends the messages matching any of its rules with a server token of its
+    own. tags lists X-Postmark-Tag values, senders lists From addresses or,
+    starting with "@", sender domains, and headers maps header names to a
+    value or a list of values. concurrency, rate_limit and rate_burst apply to
+    this route only, by default the backend's concurrency and the
+    POSTMARK_RATE_LIMIT and POSTMARK_RATE_BURST settings are used.
+    """
+
+    def __init__(self, name, api_key, tags=(), senders=(), headers=None, concurrency=None, rate_limit=None, rate_burst=None):
+        self.name = name
+        self.api_key = api_key
+        self.tags = frozenset(tags)
+        self.senders = frozenset(sender.lower() for sender in senders)
+        self.headers = {}
+        for header, values in (headers or {}).iteritems():
+            self.headers[header.lower()] = frozenset([values] if isinstance(values, basestring) else values)
+        self.concurrency = concurrency
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst
+
+    def matches(self, message):
+        """
+        Whether message, a PostmarkMessage or its payload dict, goes through
+        this route.
+        """
+        if self.tags and message.get("Tag") in self.tags:
+            return True
+
+        if self.senders:
+            sender = parseaddr(message.get("From") or "")[1].lower()
+            if sender in self.senders or ("@" in sender and "@" + sender.rpartition("@")[2] in self.senders):
+                return True
+
+        if self.headers:
+            for header in message.get("Headers") or ():
+                values = self.headers.get(header["Name"].lower())
+                if values is not None and header["Value"] in values:
+                    return True
+
+        return False
+
+    def __repr__(self):
+        return "<Route: %s>" % self.name
+
+def get_routes(routes=None):
+    """
+    Returns Route objects for a list of dicts of their arguments,
+    POSTMARK_ROUTES by default.
+    """
+    if routes is None:
+        routes = POSTMARK_ROUTES
+
+    result = []
+    for options in routes:
+        if isinstance(options, Route):
+            result.append(options)
+            continue
+        if not options.get("name") or not options.get("api_key"):
+            raise ImproperlyConfigured("Every entry of POSTMARK_ROUTES needs a name and an api_key.")
+        try:
+            result.append(Route(**options))
+        except TypeError, e:
+            raise ImproperlyConfigured("Invalid POSTMARK_ROUTES entry %s: %s" % (options["name"], e))
+    return result
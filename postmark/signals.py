@@ -1,3 +1,16 @@
 from django.dispatch import Signal
 
-post_send = Signal(providing_args=["message", "response"])
\ No newline at end of file
+post_send = Signal(providing_args=["message", "response"])
+post_send_batch = Signal(providing_args=["messages", "responses"])
+inbound_received = Signal(providing_args=["message", "attachments"])
+
+circuit_state_changed = Signal(providing_args=["name", "old_state", "new_state"])
+
+# Instrumentation, durations are in seconds and sizes in bytes
+post_convert = Signal(providing_args=["batch_size", "duration"])
+post_encode = Signal(providing_args=["batch_size", "bytes", "duration"])
+pre_request = Signal(providing_args=["url", "batch_size", "bytes", "attempt"])
+post_request = Signal(providing_args=["url", "batch_size", "bytes", "attempt", "status", "duration"])
+post_persist = Signal(providing_args=["accepted", "rejected", "duration"])
+pre_webhook = Signal(providing_args=["hook", "request"])
+post_webhook = Signal(providing_args=["hook", "request", "status", "bytes", "duration"])
@@ -0,0 +1,95 @@
+from __future__ import with_statement
+
+from django.conf import settings
+from email.utils import parseaddr
+import collections
+import threading
+import time
+
+# Settings
+POSTMARK_SUPPRESSION = getattr(settings, "POSTMARK_SUPPRESSION", False)
+POSTMARK_SUPPRESSION_BOUNCE_TYPES = getattr(settings, "POSTMARK_SUPPRESSION_BOUNCE_TYPES", ("HardBounce", "SpamComplaint"))
+POSTMARK_SUPPRESSION_CACHE_SIZE = getattr(settings, "POSTMARK_SUPPRESSION_CACHE_SIZE", 100000)
+POSTMARK_SUPPRESSION_CACHE_TTL = getattr(settings, "POSTMARK_SUPPRESSION_CACHE_TTL", 300)
+
+class SuppressionCache(object):
+    """
+    A thread safe, in-process cache of whether addresses are suppressed.
+    Holds at most max_size addresses, evicting the least recently used
+    first, and forgets each answer after ttl seconds so suppressions added or
+    removed by other processes are picked up.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+
+    def get_many(self, addresses):
+        """
+        Returns a dict of the cached answers for addresses, leaving out the
+        ones that are not cached or have expired.
+        """
+        now = time.time()
+        found = {}
+        with self._lock:
+            for address in addresses:
+                entry = self._entries.pop(address, None)
+                if entry is None or entry[1] < now:
+                    continue
+                self._entries[address] = entry
+                found[address] = entry[0]
+        return found
+
+    def set_many(self, answers):
+        expires = time.time() + self.ttl
+        with self._lock:
+            for address, suppressed in answers.iteritems():
+                self._entries.pop(address, None)
+                self._entries[address] = (suppressed, expires)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, addresses=None):
+        """
+        Forgets the given addresses, or everything if addresses is None.
+        """
+        with self._lock:
+            if addresses is None:
+                self._entries.clear()
+            else:
+                for address in addresses:
+                    self._entries.pop(address, None)
+
+cache = SuppressionCache(POSTMARK_SUPPRESSION_CACHE_SIZE, POSTMARK_SUPPRESSION_CACHE_TTL)
+
+def normalize_address(address):
+    """
+    Reduces an address such as "John <John@Example.com>" to the form it is
+    stored in the suppression list, "john@example.com".
+    """
+    return parseaddr(address)[1].strip().lower()
+
+def suppressed_addresses(addresses):
+    """
+    Returns the set of the (normalized) addresses among addresses that are on
+    the suppression list. Cached answers are used where possible and the rest
+    are looked up with one query per few hundred addresses.
+    """
+    from postmark.models import Suppression, QUERY_CHUNK_SIZE, _chunked
+
+    addresses = set(normalize_address(address) for address in addresses)
+    answers = cache.get_many(addresses)
+
+    missing = addresses.difference(answers)
+    if missing:
+        looked_up = dict.fromkeys(missing, False)
+        for chunk in _chunked(missing, QUERY_CHUNK_SIZE):
+            for email in Suppression.objects.filter(email__in=chunk).values_list("email", flat=True):
+                looked_up[email] = True
+        cache.set_many(looked_up)
+        answers.update(looked_up)
+
+    return set(address for address, suppressed in answers.iteritems() if suppressed)
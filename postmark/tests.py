@@ -0,0 +1,117 @@
+from django.utils import unittest
+from StringIO import StringIO
+import base64
+import json
+
+from postmark.inbound import StreamParser, Base64Writer, JSONStreamError, parse_inbound
+
+class StreamParserTest(unittest.TestCase):
+
+    def parse(self, data, chunk_size):
+        return StreamParser(StringIO(data), chunk_size).value()
+
+    def assertParses(self, data):
+        expected = json.loads(data)
+        for chunk_size in range(1, len(data) + 2):
+            self.assertEqual(self.parse(data, chunk_size), expected, "chunk_size %d" % chunk_size)
+
+    def assertMalformed(self, data):
+        for chunk_size in range(1, len(data) + 2):
+            self.assertRaises(JSONStreamError, self.parse, data, chunk_size)
+
+    def test_values(self):
+        self.assertParses('{"a": [1, -2.5e3, 0.5, true, false, null, {}, []], "b": {"c": "d"}}')
+        self.assertParses(' [ 1 , "x" , { "k" : "v" } ] ')
+        self.assertParses('"just a string"')
+        self.assertParses('12')
+
+    def test_escapes(self):
+        self.assertParses(r'["\"\\\/\b\f\n\r\t", "a\"b", "\\"]')
+
+    def test_unicode(self):
+        self.assertParses(r'["caf\u00e9", "\u20ac \u0000"]')
+        self.assertParses('["caf\xc3\xa9", "\xe2\x82\xac\xf0\x9f\x98\x80"]')
+
+    def test_surrogate_pairs(self):
+        self.assertParses(r'"\ud83d\ude00 and \ud834\udd1e"')
+        self.assertEqual(self.parse(r'"\ud83d\ude00"', 1), u"\U0001f600")
+
+    def test_lone_surrogate(self):
+        self.assertParses(r'["\ud83dx", "\ude00"]')
+        self.assertParses(r'"\ud83d"')
+
+    def test_invalid_surrogate_pair(self):
+        self.assertMalformed(r'"\ud83d\u0041"')
+
+    def test_malformed(self):
+        for data in ('{"a": }', '{"a" 1}', '{a: 1}', '[1 2]', '[1,]', '{"a": tru}', '"\\q"', '"\\u12g4"', 'nope'):
+            self.assertMalformed(data)
+
+    def test_truncated(self):
+        data = '{"a": [1, "xyz", {"b": "\\u00e9"}]}'
+        for end in range(1, len(data)):
+            self.assertMalformed(data[:end])
+
+    def test_iter_string(self):
+        data = '"%s"' % ("abc" * 100)
+        pieces = list(StreamParser(StringIO(data), 7).iter_string())
+        self.assertTrue(len(pieces) > 1)
+        self.assertEqual("".join(pieces), "abc" * 100)
+
+class Base64WriterTest(unittest.TestCase):
+
+    def decode(self, data, piece_size):
+        fp = StringIO()
+        writer = Base64Writer(fp)
+        for i in range(0, len(data), piece_size):
+            writer.write(data[i:i + piece_size])
+        writer.close()
+        self.assertEqual(writer.size, len(fp.getvalue()))
+        return fp.getvalue()
+
+    def test_pieces(self):
+        content = "".join(chr(i) for i in range(256)) * 3
+        encoded = base64.encodestring(content)
+        for piece_size in (1, 2, 3, 5, 76, len(encoded)):
+            self.assertEqual(self.decode(encoded, piece_size), content)
+
+    def test_missing_padding(self):
+        self.assertEqual(self.decode("aGVsbG8", 3), "hello")
+
+    def test_invalid(self):
+        self.assertRaises(JSONStreamError, self.decode, "a", 1)
+
+class ParseInboundTest(unittest.TestCase):
+
+    def save_attachment(self, fields, content, size):
+        fields["Data"] = content.read()
+        fields["Size"] = size
+        return fields
+
+    def test_payload(self):
+        content = "hello \xff world" * 50
+        data = json.dumps({
+            "MessageID": "abc",
+            "Subject": u"Caf\xe9",
+            "Headers": [{"Name": "X-A", "Value": "1"}],
+            "Attachments": [
+                {"Name": "a.bin", "Content": base64.b64encode(content), "ContentType": "application/octet-stream"},
+                {"Name": "b.txt", "Content": base64.b64encode("b").replace("/", "\\/")},
+            ],
+        })
+        for chunk_size in (1, 4, 100, len(data)):
+            payload = parse_inbound(StringIO(data), self.save_attachment, chunk_size)
+            self.assertEqual(payload["MessageID"], "abc")
+            self.assertEqual(payload["Subject"], u"Caf\xe9")
+            self.assertEqual(payload["Headers"], [{"Name": "X-A", "Value": "1"}])
+            self.assertEqual(payload["Attachments"], [
+                {"Name": "a.bin", "ContentType": "application/octet-stream", "Data": content, "Size": len(content)},
+                {"Name": "b.txt", "Data": "b", "Size": 1},
+            ])
+
+    def test_trailing_data(self):
+        self.assertRaises(JSONStreamError, parse_inbound, StringIO('{"a": 1} {}'), self.save_attachment)
+
+    def test_truncated(self):
+        data = '{"Attachments": [{"Name": "a", "Content": "aGVsbG8="}]}'
+        self.assertRaises(JSONStreamError, parse_inbound, StringIO(data[:-5]), self.save_attachment, 3)
@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+import pytz
+
+# Offsets from UTC by the suffix they were parsed from, e.g. "-04:00"
+_OFFSETS = {"Z": timedelta(0), "": timedelta(0)}
+
+def _offset(suffix):
+    offset = _OFFSETS.get(suffix)
+    if offset is None:
+        offset = timedelta(minutes=int(suffix[1:3]) * 60 + int(suffix[-2:]))
+        if suffix[0] == "-":
+            offset = -offset
+        _OFFSETS[suffix] = offset
+    return offset
+
+def parse_timestamp(value):
+    """
+    Parses a timestamp as sent by Postmark, such as SubmittedAt or BouncedAt,
+    and returns it as an aware datetime in UTC. Postmark sends up to seven
+    fractional digits and an offset from UTC which may be negative, e.g.:
+    
+        2011-05-23T11:16:00.3018994+01:00
+        2011-05-23T06:16:00-04:00
+    """
+    rest = value[19:]
+    for i, char in enumerate(rest):
+        if char in "+-Z":
+            fraction, suffix = rest[:i], rest[i:]
+            break
+    else:
+        fraction, suffix = rest, ""
+    
+    return datetime(
+        int(value[0:4]), int(value[5:7]), int(value[8:10]),
+        int(value[11:13]), int(value[14:16]), int(value[17:19]),
+        int((fraction[1:] + "000000")[:6]) if fraction else 0,
+        pytz.utc,
+    ) - _offset(suffix)
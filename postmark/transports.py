@@ -0,0 +1,165 @@
+from __future__ import with_statement
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.importlib import import_module
+from django.conf import settings
+import threading
+import socket
+import errno
+import Queue
+import os
+import httplib2
+
+# Settings
+POSTMARK_TRANSPORT = getattr(settings, "POSTMARK_TRANSPORT", "postmark.transports.HttpLib2Transport")
+POSTMARK_POOL_SIZE = getattr(settings, "POSTMARK_POOL_SIZE", 4)
+POSTMARK_TIMEOUT = getattr(settings, "POSTMARK_TIMEOUT", None)
+
+class TransportError(Exception):
+    """
+    Raised by a transport when a request could not be completed, wrapping
+    whatever the underlying HTTP library raised. request_sent is False only
+    when the request provably never reached the server, e.g. because the
+    connection was refused.
+    """
+    def __init__(self, value, inner_exception=None, request_sent=True):
+        self.parameter = value
+        self.inner_exception = inner_exception
+        self.request_sent = request_sent
+    def __str__(self):
+        return repr(self.parameter)
+
+class BaseTransport(object):
+    """
+    Base class for the HTTP layer used by the backends. A transport owns its
+    connections; open() and close() mirror BaseEmailBackend so a backend can
+    hand its own lifecycle straight through.
+    """
+
+    def __init__(self, pool_size=None, timeout=None):
+        self.pool_size = pool_size or POSTMARK_POOL_SIZE
+        self.timeout = timeout if timeout is not None else POSTMARK_TIMEOUT
+
+    def open(self):
+        """
+        Prepares the transport for use. Returns True if new connections were
+        set up and False if the transport was already open.
+        """
+        return False
+
+    def close(self):
+        """
+        Releases any connections held by the transport.
+        """
+        pass
+
+    def request(self, url, body, headers, method="POST"):
+        """
+        Sends body to url, POSTing unless method says otherwise, and returns a
+        (status, headers, content) tuple where status is an int and headers is
+        a dict with lowercased keys. Raises TransportError if no response could
+        be obtained.
+        
+        body is either a string or a file-like object, in which case headers
+        carries its Content-Length. GET requests have a body of None.
+        """
+        raise NotImplementedError
+
+class HttpLib2Transport(BaseTransport):
+    """
+    Keeps a pool of up to pool_size httplib2.Http objects, each of which holds
+    a keep-alive connection to Postmark. The pool is private to the transport
+    and is rebuilt when used from a forked child, so sockets are never shared
+    between processes.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(HttpLib2Transport, self).__init__(*args, **kwargs)
+
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+
+    def open(self):
+        with self._lock:
+            if self._pool is not None and self._pid == os.getpid():
+                return False
+
+            # Slots start empty and are filled lazily, a full queue bounds the
+            # number of connections open at once.
+            self._pool = Queue.LifoQueue(self.pool_size)
+            for i in xrange(self.pool_size):
+                self._pool.put(None)
+            self._pid = os.getpid()
+            return True
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+            pid, self._pid = self._pid, None
+
+        if pool is None or pid != os.getpid():
+            return
+
+        while True:
+            try:
+                http = pool.get_nowait()
+            except Queue.Empty:
+                break
+            self._close_http(http)
+
+    def request(self, url, body, headers, method="POST"):
+        if self._pool is None or self._pid != os.getpid():
+            self.open()
+        pool = self._pool
+
+        http = pool.get()
+        if http is None:
+            http = httplib2.Http(timeout=self.timeout)
+
+        try:
+            resp, content = http.request(url, body=body, method=method, headers=headers)
+        except (httplib2.HttpLib2Error, socket.error), e:
+            # The connection is in an unknown state, drop it from the pool.
+            self._close_http(http)
+            pool.put(None)
+            raise TransportError(str(e), e, request_sent=not self._not_connected(e))
+        except:
+            self._close_http(http)
+            pool.put(None)
+            raise
+
+        pool.put(http)
+        return int(resp.status), dict(resp.iteritems()), content
+
+    def _not_connected(self, error):
+        # Failures to resolve or connect happen before anything is written.
+        # A timeout may be one to connect, but can't be told from a read one.
+        if isinstance(error, (httplib2.ServerNotFoundError, socket.gaierror)):
+            return True
+        return isinstance(error, socket.error) and error.errno in (errno.ECONNREFUSED, errno.ENETUNREACH, errno.EHOSTUNREACH)
+
+    def _close_http(self, http):
+        if http is None:
+            return
+        for conn in http.connections.values():
+            try:
+                conn.close()
+            except socket.error:
+                pass
+        http.connections.clear()
+
+def get_transport(path=None, **kwargs):
+    """
+    Loads the transport class named by path (POSTMARK_TRANSPORT by default)
+    and returns an instance of it.
+    """
+    path = path or POSTMARK_TRANSPORT
+
+    try:
+        module_name, class_name = path.rsplit(".", 1)
+        transport_class = getattr(import_module(module_name), class_name)
+    except (ImportError, AttributeError, ValueError), e:
+        raise ImproperlyConfigured("Error importing Postmark transport %s: \"%s\"" % (path, e))
+
+    return transport_class(**kwargs)
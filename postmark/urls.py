@@ -2,4 +2,9 @@ from django.conf.urls.defaults import *
 
 urlpatterns = patterns("",
     url(r"^bounce/$", "postmark.views.bounce", name="postmark_bounce_hook"),
+    url(r"^inbound/$", "postmark.views.inbound", name="postmark_inbound_hook"),
+    url(r"^delivery/$", "postmark.views.delivered", name="postmark_delivery_hook"),
+    url(r"^open/$", "postmark.views.opened", name="postmark_open_hook"),
+    url(r"^click/$", "postmark.views.clicked", name="postmark_click_hook"),
+    url(r"^metrics/$", "postmark.views.metrics", name="postmark_metrics"),
 )
\ No newline at end of file
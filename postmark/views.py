@@ -1,14 +1,18 @@
-from django.http import HttpResponse, HttpResponseNotAllowed, HttpResponseBadRequest, HttpResponseForbidden
+from __future__ import with_statement
+
+from django.http import HttpResponse, HttpResponseNotAllowed, HttpResponseBadRequest, HttpResponseForbidden, Http404
 from django.core.exceptions import ImproperlyConfigured
 from django.views.decorators.csrf import csrf_exempt
-from django.shortcuts import get_object_or_404
+from django.utils.functional import wraps
+from django.db import transaction
 from django.conf import settings
-from datetime import datetime
-from pytz import timezone
-import pytz
 import base64
+import time
 
-from postmark.models import EmailMessage, EmailBounce
+from postmark.models import EmailBounce, BounceInbox, bounce_payloads, InboundMessage, EmailEvent
+from postmark.signals import pre_webhook, post_webhook, inbound_received
+from postmark.events import buffer as event_buffer
+from postmark import metrics as postmark_metrics
 
 try:
     import json                     
@@ -18,17 +22,60 @@ except ImportError:
     except ImportError:
         raise Exception('Cannot use django-postmark without Python 2.6 or greater, or Python 2.4 or 2.5 and the "simplejson" library')
 
-POSTMARK_DATETIME_STRING = "%Y-%m-%dT%H:%M:%S.%f"
-
 # Settings
 POSTMARK_API_USER = getattr(settings, "POSTMARK_API_USER", None)
 POSTMARK_API_PASSWORD = getattr(settings, "POSTMARK_API_PASSWORD", None)
+POSTMARK_BOUNCE_DEFERRED = getattr(settings, "POSTMARK_BOUNCE_DEFERRED", False)
 
 if ((POSTMARK_API_USER is not None and POSTMARK_API_PASSWORD is None) or
     (POSTMARK_API_PASSWORD is not None and POSTMARK_API_USER is None)):
     raise ImproperlyConfigured("POSTMARK_API_USER and POSTMARK_API_PASSWORD must both either be set, or unset.")
 
+def authorized(request):
+    """
+    Checks the request's HTTP basic auth credentials against POSTMARK_API_USER
+    and POSTMARK_API_PASSWORD, if they are set.
+    """
+    if POSTMARK_API_USER is None:
+        return True
+    if not request.META.has_key("HTTP_AUTHORIZATION"):
+        return False
+    
+    type, base64encoded = request.META["HTTP_AUTHORIZATION"].split(" ", 1)
+    
+    if type.lower() == "basic":
+        username_password = base64.decodestring(base64encoded)
+    else:
+        return False
+    
+    return username_password == "%s:%s" % (POSTMARK_API_USER, POSTMARK_API_PASSWORD)
+
+def instrumented(hook):
+    """
+    Sends pre_webhook and post_webhook around a view, the latter with the
+    response's status code, the size of the request body and the time taken.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            pre_webhook.send(sender=view, hook=hook, request=request)
+            start = time.time()
+            status = 500
+            try:
+                response = view(request, *args, **kwargs)
+                status = response.status_code
+                return response
+            except Http404:
+                status = 404
+                raise
+            finally:
+                post_webhook.send(sender=view, hook=hook, request=request, status=status,
+                    bytes=int(request.META.get("CONTENT_LENGTH") or 0), duration=time.time() - start)
+        return wrapper
+    return decorator
+
 @csrf_exempt
+@instrumented("bounce")
 def bounce(request):
     """
     Accepts Incoming Bounces from Postmark. Example JSON Message:
@@ -50,46 +97,145 @@ def bounce(request):
             "Content": null,
             "Subject": null
         }
+    
+    A JSON array of such bounces is accepted as well and ingested in bulk, in
+    which case bounces for unknown messages are skipped instead of answered
+    with a 404. Payloads that are not bounces are answered with a 400.
+    
+    With POSTMARK_BOUNCE_DEFERRED set the raw request body is only stored in
+    the BounceInbox table, for the postmark_process_bounces command to ingest
+    later on.
+    """
+    if request.method in ["POST"]:
+        if not authorized(request):
+            return HttpResponseForbidden()
+        
+        if POSTMARK_BOUNCE_DEFERRED:
+            BounceInbox.objects.create(payload=request.read())
+            return HttpResponse(json.dumps({"status": "ok"}))
+        
+        try:
+            bounce_dict = json.loads(request.read())
+            bounces = bounce_payloads(bounce_dict)
+        except ValueError, e:
+            return HttpResponseBadRequest(json.dumps({"status": "error", "message": str(e)}))
+        
+        if isinstance(bounce_dict, list):
+            created = EmailBounce.objects.ingest(bounces)
+            return HttpResponse(json.dumps({"status": "ok", "created": len(created)}))
+        
+        unmatched = []
+        EmailBounce.objects.ingest(bounces, unmatched=unmatched)
+        if unmatched:
+            raise Http404("No message %s to %s." % (bounce_dict["MessageID"], bounce_dict["Email"]))
+        
+        return HttpResponse(json.dumps({"status": "ok"}))
+    else:
+        return HttpResponseNotAllowed(['POST'])
+
+@csrf_exempt
+@instrumented("inbound")
+def inbound(request):
+    """
+    Accepts Inbound messages from Postmark. The JSON payload is parsed as it
+    is read and attachments are decoded straight to storage, so large
+    messages are never held in memory whole. Once stored, inbound_received is
+    sent with the InboundMessage and its InboundAttachments, whose files are
+    only opened when read.
+    
+    A message Postmark delivers again is acknowledged without storing it or
+    sending the signal a second time.
     """
     if request.method in ["POST"]:
-        if POSTMARK_API_USER is not None:
-            if not request.META.has_key("HTTP_AUTHORIZATION"):
-                return HttpResponseForbidden()
-                
-            type, base64encoded = request.META["HTTP_AUTHORIZATION"].split(" ", 1)
-            print type, base64encoded
-            
-            if type.lower() == "basic":
-                username_password = base64.decodestring(base64encoded)
-                print username_password
-            else:
-                return HttpResponseForbidden()
-                
-            if not username_password == "%s:%s" % (POSTMARK_API_USER, POSTMARK_API_PASSWORD):
-                print "lol"
-                return HttpResponseForbidden()
+        if not authorized(request):
+            return HttpResponseForbidden()
+        
+        try:
+            with transaction.commit_on_success():
+                message, attachments = InboundMessage.objects.ingest(request)
+        except ValueError, e:
+            return HttpResponseBadRequest(json.dumps({"status": "error", "message": str(e)}))
         
-        bounce_dict = json.loads(request.read())
-            
-        timestamp, tz = bounce_dict["BouncedAt"].rsplit("+", 1)
-        tz_offset = int(tz.split(":", 1)[0])
-        tz = timezone("Etc/GMT%s%d" % ("+" if tz_offset >= 0 else "-", tz_offset))
-        bounced_at = tz.localize(datetime.strptime(timestamp[:26], POSTMARK_DATETIME_STRING)).astimezone(pytz.utc)
-            
-        em = get_object_or_404(EmailMessage, message_id=bounce_dict["MessageID"], to=bounce_dict["Email"])
-        eb, created = EmailBounce.objects.get_or_create(
-            id=bounce_dict["ID"],
-            default={
-                "message": em,
-                "type": bounce_dict["Type"],
-                "description": bounce_dict["Description"],
-                "details": bounce_dict["Details"],
-                "inactive": bounce_dict["Inactive"],
-                "can_activate": bounce_dict["CanActivate"],
-                "bounced_at": bounced_at,
-            }
-        )
+        if message is not None:
+            inbound_received.send(sender=InboundMessage, message=message, attachments=attachments)
         
         return HttpResponse(json.dumps({"status": "ok"}))
     else:
         return HttpResponseNotAllowed(['POST'])
+
+def record_events(request, type):
+    """
+    Buffers the events of a webhook request, a single JSON payload or an array
+    of them, for postmark.events.buffer to write in bulk.
+    """
+    if request.method in ["POST"]:
+        if not authorized(request):
+            return HttpResponseForbidden()
+        
+        try:
+            payload = json.loads(request.read())
+            events = [EmailEvent.from_payload(type, item) for item in (payload if isinstance(payload, list) else [payload])]
+        except (ValueError, KeyError, TypeError, AttributeError), e:
+            return HttpResponseBadRequest(json.dumps({"status": "error", "message": str(e)}))
+        
+        event_buffer.add(events)
+        return HttpResponse(json.dumps({"status": "ok"}))
+    else:
+        return HttpResponseNotAllowed(['POST'])
+
+@csrf_exempt
+@instrumented("delivery")
+def delivered(request):
+    """
+    Accepts Delivery webhooks from Postmark. Example JSON Message:
+    
+        {
+            "RecordType": "Delivery",
+            "MessageID": "883953f4-6105-42a2-a16a-77a8eac79483",
+            "Recipient": "john@example.com",
+            "DeliveredAt": "2014-08-01T13:28:10.2735393-04:00",
+            "Details": "Test delivery webhook details",
+            "Tag": "welcome-email"
+        }
+    """
+    return record_events(request, "Delivery")
+
+@csrf_exempt
+@instrumented("open")
+def opened(request):
+    """
+    Accepts Open tracking webhooks from Postmark. Example JSON Message:
+    
+        {
+            "RecordType": "Open",
+            "FirstOpen": true,
+            "MessageID": "883953f4-6105-42a2-a16a-77a8eac79483",
+            "Recipient": "john@example.com",
+            "ReceivedAt": "2014-08-01T13:28:10.2735393-04:00",
+            "Platform": "WebMail",
+            "UserAgent": "Mozilla/5.0",
+            "Tag": "welcome-email"
+        }
+    """
+    return record_events(request, "Open")
+
+@csrf_exempt
+@instrumented("click")
+def clicked(request):
+    """
+    Accepts Click tracking webhooks from Postmark, which look like open ones
+    with an OriginalLink and a ClickLocation.
+    """
+    return record_events(request, "Click")
+
+def metrics(request):
+    """
+    Exposes the counters and histograms collected by postmark.metrics in the
+    Prometheus text format. Answers 404 unless POSTMARK_METRICS is set, and
+    requires the same basic auth credentials as the hooks.
+    """
+    if not postmark_metrics.POSTMARK_METRICS:
+        raise Http404
+    if not authorized(request):
+        return HttpResponseForbidden()
+    return HttpResponse(postmark_metrics.registry.render(), content_type="text/plain; version=0.0.4")
@@ -16,6 +16,8 @@ setup(
     packages = [
         "postmark",
         "postmark.migrations",
+        "postmark.management",
+        "postmark.management.commands",
     ],
     classifiers = [
         "Development Status :: 4 - Beta",